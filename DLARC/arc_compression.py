@@ -0,0 +1,46 @@
+import zlib
+from typing import Callable, Dict, Tuple, Union
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Tag stored in the padding field of a DAT block; all zeroes means a raw payload
+RAW = b'\x00' * 4
+
+_Codec = Tuple[bytes, Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+def _codecs() -> Dict[str, _Codec]:
+    codecs = {'zlib': (b'ZLIB', lambda data: zlib.compress(data, 9), zlib.decompress)}
+    if lz4 is not None:
+        codecs['lz4'] = (b'LZ4F', lambda data: lz4.frame.compress(data), lz4.frame.decompress)
+    return codecs
+
+CODECS = _codecs()
+TAGS = {tag: name for name, (tag, _, _) in CODECS.items()}
+# Tags we know even when the library to decode them is missing
+KNOWN_TAGS = {b'ZLIB': 'zlib', b'LZ4F': 'lz4'}
+
+def available_methods():
+    """Names of the compression methods usable in this environment"""
+    return sorted(CODECS)
+
+def is_compressed(tag: bytes) -> bool:
+    return tag in KNOWN_TAGS
+
+def compress_payload(method: str, data: bytes) -> Tuple[bytes, bytes]:
+    """Compress data with method, returns (tag, compressed data); runs in worker processes"""
+    if method not in CODECS:
+        raise ValueError(f"Compression method {method} is not available")
+    tag, compress, _ = CODECS[method]
+    return tag, compress(data)
+
+def decompress_payload(tag: bytes, data: Union[bytes, memoryview], original_size: int) -> bytes:
+    """Decompress a stored payload and check it has the size recorded in the DIR entry"""
+    if tag not in TAGS:
+        raise ValueError(f"No decoder for {KNOWN_TAGS.get(tag, tag)} compressed data")
+    result = CODECS[TAGS[tag]][2](data)
+    if len(result) != original_size:
+        raise ValueError(f"Decompressed {len(result)} bytes, expected {original_size}")
+    return result
@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from arc_logging import instrumentation, logger
+from arc_parser import ArcFile, FileEntry
+from arc_progress import CancellationToken, ProgressCallback, ProgressTracker
+from file_extractor import content_hash
+
+class ContentStore:
+    """Content-addressed store of payloads shared by any number of archives
+
+    Each unique payload is kept once as objects/<hash[:2]>/<hash[2:]>, and every
+    archive gets an index/<archive name>.json mapping entry names to hashes.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        # Objects written or being written by this store, set once they are on disk
+        self._claimed: Dict[str, threading.Event] = {}
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'index'), exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def put(self, digest: str, data) -> bool:
+        """Store data under digest unless it is already there, returns True if this call created it"""
+        while True:
+            with self._lock:
+                written = self._claimed.get(digest)
+                owner = written is None
+                if owner:
+                    written = self._claimed[digest] = threading.Event()
+            if owner:
+                break
+            written.wait()
+            # The owner gives its claim up when it fails; then store the object here
+            if os.path.exists(self.object_path(digest)):
+                return False
+        try:
+            path = self.object_path(digest)
+            if os.path.exists(path):
+                return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            try:
+                return self._create(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except Exception:
+            # Let a later entry with the same content try again
+            with self._lock:
+                del self._claimed[digest]
+            raise
+        finally:
+            written.set()
+
+    @staticmethod
+    def _create(temp_path: str, path: str) -> bool:
+        """Move a fully written object into place unless another store created it first
+
+        Other stores, in this process or others, may add the same object at once;
+        only the one whose create succeeds reports it as new.
+        """
+        try:
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # No hard links on this file system; rename refuses to overwrite on Windows
+            try:
+                os.rename(temp_path, path)
+                return True
+            except FileExistsError:
+                return False
+
+    def index_path(self, archive_name: str) -> str:
+        return os.path.join(self.root, 'index', archive_name + '.json')
+
+    def save_index(self, archive_name: str, archive_path: Optional[str], records: Dict[str, Dict]):
+        index_path = self.index_path(archive_name)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'archive': archive_path, 'hash': 'blake2b-128', 'files': records}, f, ensure_ascii=False)
+        os.replace(index_path + '.tmp', index_path)
+
+class DedupResult:
+    """Outcome of adding one archive to a content store"""
+    def __init__(self, archive_name: str, entries: int, unique: int, new_objects: int, bytes_total: int,
+                 bytes_stored: int, failed: List[str], elapsed: float):
+        self.archive_name = archive_name
+        self.entries = entries
+        self.unique = unique
+        self.new_objects = new_objects
+        self.bytes_total = bytes_total
+        self.bytes_stored = bytes_stored
+        self.failed = failed
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return (f"DedupResult({self.archive_name}: {self.entries} entries, {self.unique} unique, "
+                f"{self.new_objects} new, {self.bytes_stored / (1024 * 1024):.1f} of "
+                f"{self.bytes_total / (1024 * 1024):.1f} MB stored in {self.elapsed:.2f}s)")
+
+class DedupExtractor:
+    """Extracts archives into a ContentStore so payloads duplicated across archives are written once"""
+    def __init__(self, store: ContentStore):
+        self.store = store
+
+    def extract(self, arc_file: ArcFile, archive_name: str, layout_dir: Optional[str] = None, link: bool = True,
+                max_workers: Optional[int] = None, progress_callback: Optional[ProgressCallback] = None,
+                cancel_token: Optional[CancellationToken] = None) -> DedupResult:
+        """Hash and store every entry of arc_file and write its index under archive_name
+
+        With layout_dir the usual extracted tree is recreated there as hard links
+        into the store (copies when link is False or linking fails). Hard-linked
+        files share their data with the store, so edit copies, not links.
+        """
+        start_time = time.perf_counter()
+        entries = arc_file.file_entries
+        tracker = ProgressTracker(len(entries), sum(entry.file_size for entry in entries), progress_callback)
+        if layout_dir is not None:
+            for directory in {os.path.dirname(os.path.join(layout_dir, entry.file_name)) for entry in entries}:
+                os.makedirs(directory or layout_dir, exist_ok=True)
+
+        def store_entry(file_entry: FileEntry) -> Optional[Dict]:
+            if cancel_token is not None and cancel_token.cancelled:
+                return None
+            try:
+                data = arc_file.get_file_data(file_entry)
+                if data is None:
+                    return None
+                digest = content_hash(data)
+                new = self.store.put(digest, data)
+                if layout_dir is not None:
+                    self._place(digest, os.path.join(layout_dir, file_entry.file_name), link)
+                tracker.advance(1, file_entry.file_size)
+                return {'hash': digest, 'size': len(data), 'new': new}
+            except Exception as e:
+                logger.error("Error storing %s: %s", file_entry.file_name, e)
+                return None
+
+        with instrumentation.phase('extraction'), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            records = list(pool.map(store_entry, entries))
+        tracker.finish()
+
+        index = {}
+        failed = []
+        new_objects = bytes_stored = 0
+        for entry, record in zip(entries, records):
+            if record is None:
+                failed.append(entry.file_name)
+                continue
+            if record.pop('new'):
+                new_objects += 1
+                bytes_stored += record['size']
+            index[entry.file_name] = record
+        if cancel_token is None or not cancel_token.cancelled:
+            self.store.save_index(archive_name, arc_file.file_path, index)
+        instrumentation.count('files_extracted', len(index))
+        instrumentation.count('bytes_extracted', bytes_stored)
+
+        return DedupResult(archive_name, len(entries), len({record['hash'] for record in index.values()}),
+                           new_objects, sum(record['size'] for record in index.values()), bytes_stored,
+                           failed, time.perf_counter() - start_time)
+
+    def _place(self, digest: str, output_path: str, link: bool):
+        """Make output_path hold the stored object, as a hard link where possible"""
+        source_path = self.store.object_path(digest)
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+        if link:
+            try:
+                os.link(source_path, output_path)
+                return
+            except OSError:
+                # Different file system, or links not supported
+                pass
+        shutil.copyfile(source_path, output_path)
@@ -1,10 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import queue
 import threading
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
+from arc_logging import logger
 from arc_parser import ArcFile, FileEntry
-from file_extractor import ArcExtractor
+from arc_progress import CancellationToken, ProgressInfo
+from file_extractor import ArcExtractor, ExtractionResult
+
+# Rows inserted into the treeview per event-loop turn while populating it
+POPULATE_CHUNK_SIZE = 500
+# Interval in ms at which work posted by background threads is picked up
+UI_POLL_INTERVAL = 50
+# Delay in ms after the last keystroke before the filter is applied
+FILTER_DELAY = 200
 
 class ArcUnpackerGUI:
     """Main GUI for the ARC Unpacker application"""
@@ -18,8 +28,16 @@ class ArcUnpackerGUI:
         self.arc_file: Optional[ArcFile] = None
         self.extractor: Optional[ArcExtractor] = None
         self.selected_files: List[FileEntry] = []
+        self.file_info: List[Tuple[str, str, str]] = []
+        
+        # Background threads never touch Tk directly; they post callables here
+        self.ui_queue: "queue.Queue[Callable[[], None]]" = queue.Queue()
+        self.populate_job: Optional[str] = None
+        self.filter_job: Optional[str] = None
+        self.cancel_token: Optional[CancellationToken] = None
         
         self.setup_ui()
+        self.root.after(UI_POLL_INTERVAL, self.process_ui_queue)
     
     def setup_ui(self):
         """Setup the user interface"""
@@ -41,12 +59,22 @@ class ArcUnpackerGUI:
         self.file_entry = ttk.Entry(file_frame, textvariable=self.file_path_var, state="readonly")
         self.file_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
         
-        ttk.Button(file_frame, text="Browse", command=self.browse_file).grid(row=0, column=1)
+        self.browse_button = ttk.Button(file_frame, text="Browse", command=self.browse_file)
+        self.browse_button.grid(row=0, column=1)
         
         list_frame = ttk.LabelFrame(main_frame, text="Files in Archive", padding="5")
         list_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         list_frame.columnconfigure(0, weight=1)
-        list_frame.rowconfigure(0, weight=1)
+        list_frame.rowconfigure(1, weight=1)
+        
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        filter_frame.columnconfigure(1, weight=1)
+        
+        ttk.Label(filter_frame, text="Filter:").grid(row=0, column=0, padx=(0, 5))
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", self.on_filter_changed)
+        ttk.Entry(filter_frame, textvariable=self.filter_var).grid(row=0, column=1, sticky=(tk.W, tk.E))
         
         columns = ("Name", "Address", "Formatted Size")
         self.file_tree = ttk.Treeview(list_frame, columns=columns, show="headings", selectmode="extended")
@@ -63,9 +91,9 @@ class ArcUnpackerGUI:
         tree_scroll_x = ttk.Scrollbar(list_frame, orient=tk.HORIZONTAL, command=self.file_tree.xview)
         self.file_tree.configure(yscrollcommand=tree_scroll_y.set, xscrollcommand=tree_scroll_x.set)
         
-        self.file_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        tree_scroll_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        tree_scroll_x.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.file_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        tree_scroll_y.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        tree_scroll_x.grid(row=2, column=0, sticky=(tk.W, tk.E))
         
         self.file_tree.bind('<<TreeviewSelect>>', self.on_file_selection)
         
@@ -74,13 +102,19 @@ class ArcUnpackerGUI:
         
         ttk.Button(button_frame, text="Select All", command=self.select_all_files).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(button_frame, text="Clear Selection", command=self.clear_selection).pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(button_frame, text="Extract Selected", command=self.extract_selected).pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(button_frame, text="Extract All", command=self.extract_all).pack(side=tk.LEFT, padx=(0, 5))
+        self.extract_selected_button = ttk.Button(button_frame, text="Extract Selected", command=self.extract_selected)
+        self.extract_selected_button.pack(side=tk.LEFT, padx=(0, 5))
+        self.extract_all_button = ttk.Button(button_frame, text="Extract All", command=self.extract_all)
+        self.extract_all_button.pack(side=tk.LEFT, padx=(0, 5))
         
         self.replace_button = ttk.Button(button_frame, text="Replace File", command=self.replace_file, state="disabled")
         self.replace_button.pack(side=tk.LEFT, padx=(0, 5))
         
-        ttk.Button(button_frame, text="Regenerate", command=self.regenerate).pack(side=tk.LEFT, padx=(0, 5))
+        self.regenerate_button = ttk.Button(button_frame, text="Regenerate", command=self.regenerate)
+        self.regenerate_button.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_job, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 5))
         
         self.status_var = tk.StringVar(value="Ready")
         status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
@@ -100,34 +134,116 @@ class ArcUnpackerGUI:
         if file_path:
             self.load_arc_file(file_path)
     
-    def load_arc_file(self, file_path: str):
-        """Load and parse ARC file"""
+    def run_on_ui(self, callback: Callable, *args):
+        """Schedule callback(*args) on the Tk thread; safe to call from any thread"""
+        self.ui_queue.put(lambda: callback(*args))
+    
+    def process_ui_queue(self):
+        """Run the callables posted by background threads"""
         try:
-            self.status_var.set("Loading ARC file...")
-            self.root.update()
-            
-            self.arc_file = ArcFile.parse(file_path)
-            self.extractor = ArcExtractor(self.arc_file)
-            
-            self.file_path_var.set(file_path)
-            
-            self.populate_file_list()
-            
-            self.status_var.set(f"Loaded {len(self.arc_file.file_entries)} files")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load ARC file:\n{str(e)}")
-            self.status_var.set("Error loading file")
+            while True:
+                callback = self.ui_queue.get_nowait()
+                try:
+                    callback()
+                except Exception:
+                    # One failing callback must not stop progress and cancellation updates
+                    logger.exception("Error in UI callback")
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(UI_POLL_INTERVAL, self.process_ui_queue)
     
-    def populate_file_list(self):
-        """Populate the file list treeview"""
-        for item in self.file_tree.get_children():
-            self.file_tree.delete(item)
+    def load_arc_file(self, file_path: str):
+        """Load and parse ARC file in a background thread"""
+        if self.busy:
+            return
+        self.start_job("Loading ARC file...", cancellable=False)
+        
+        def load_thread():
+            try:
+                arc_file = ArcFile.parse(file_path, use_mmap=True)
+                self.run_on_ui(self.on_arc_file_loaded, file_path, arc_file)
+            except Exception as e:
+                self.run_on_ui(self.on_arc_file_failed, e)
+        
+        thread = threading.Thread(target=load_thread, daemon=True)
+        thread.start()
+    
+    def on_arc_file_loaded(self, file_path: str, arc_file: ArcFile):
+        """Swap in a freshly parsed ARC file"""
+        # Actions are disabled while loading, so no job still reads the old archive
+        self.finish_job()
+        if self.arc_file is not None:
+            self.arc_file.close()
+        
+        self.arc_file = arc_file
+        self.extractor = ArcExtractor(self.arc_file)
+        self.selected_files = []
         
-        file_info = self.extractor.get_file_info()
+        self.file_path_var.set(file_path)
         
-        for name, addr, formatted_size in file_info:
-            self.file_tree.insert("", tk.END, values=(name, addr, formatted_size))
+        self.populate_file_list()
+        
+        self.status_var.set(f"Loaded {len(self.arc_file.file_entries)} files in {self.arc_file.parse_time * 1000:.0f} ms")
+    
+    def on_arc_file_failed(self, error: Exception):
+        """Report a failed load"""
+        self.finish_job()
+        messagebox.showerror("Error", f"Failed to load ARC file:\n{str(error)}")
+        self.status_var.set("Error loading file")
+    
+    def populate_file_list(self):
+        """Populate the file list treeview with the entries matching the filter"""
+        self.file_info = self.extractor.get_file_info()
+        self.show_rows(self.filtered_indices())
+    
+    def filtered_indices(self) -> List[int]:
+        """Positions of the entries matching the filter box
+
+        Glob patterns and exact names select every matching entry, duplicates included; anything
+        else is a case-insensitive substring match.
+        """
+        pattern = self.filter_var.get().strip()
+        if not pattern:
+            return list(range(len(self.file_info)))
+        
+        if any(c in pattern for c in '*?[') or self.arc_file.index_of_name(pattern) is not None:
+            return [self.arc_file.index_of(entry) for entry in self.arc_file.find_entries(pattern)]
+        
+        needle = pattern.lower()
+        return [i for i, (name, _, _) in enumerate(self.file_info) if needle in name.lower()]
+    
+    def show_rows(self, indices: List[int]):
+        """Replace the treeview rows, inserting them in chunks between Tk events"""
+        if self.populate_job is not None:
+            self.root.after_cancel(self.populate_job)
+            self.populate_job = None
+        
+        self.file_tree.delete(*self.file_tree.get_children())
+        self.insert_rows(indices, 0)
+    
+    def insert_rows(self, indices: List[int], start: int):
+        """Insert one chunk of rows and schedule the next one"""
+        # Row ids are entry positions, so selections map straight back to entries
+        for index in indices[start:start + POPULATE_CHUNK_SIZE]:
+            self.file_tree.insert("", tk.END, iid=str(index), values=self.file_info[index])
+        
+        if start + POPULATE_CHUNK_SIZE < len(indices):
+            self.populate_job = self.root.after(1, self.insert_rows, indices, start + POPULATE_CHUNK_SIZE)
+        else:
+            self.populate_job = None
+    
+    def on_filter_changed(self, *args):
+        """Re-filter the file list shortly after the user stops typing"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY, self.apply_filter)
+    
+    def apply_filter(self):
+        """Show only the entries matching the filter box"""
+        self.filter_job = None
+        if self.arc_file is not None:
+            self.show_rows(self.filtered_indices())
     
     def on_file_selection(self, event):
         """Handle file selection in treeview"""
@@ -135,13 +251,7 @@ class ArcUnpackerGUI:
         self.selected_files = []
         
         for item in selection:
-            values = self.file_tree.item(item, "values")
-            file_name = values[0]
-            
-            for entry in self.arc_file.file_entries:
-                if entry.file_name == file_name:
-                    self.selected_files.append(entry)
-                    break
+            self.selected_files.append(self.arc_file.file_entries[int(item)])
         
         if self.selected_files:
             total_size = sum(f.file_size for f in self.selected_files)
@@ -156,15 +266,14 @@ class ArcUnpackerGUI:
         else:
             self.status_var.set("No files selected")
         
-        if len(self.selected_files) == 1:
+        if len(self.selected_files) == 1 and not self.busy:
             self.replace_button.config(state="normal")
         else:
             self.replace_button.config(state="disabled")
     
     def select_all_files(self):
         """Select all files in the list"""
-        for item in self.file_tree.get_children():
-            self.file_tree.selection_add(item)
+        self.file_tree.selection_set(self.file_tree.get_children())
         self.replace_button.config(state="disabled")
     
     def clear_selection(self):
@@ -188,40 +297,101 @@ class ArcUnpackerGUI:
         
         self.extract_files(self.arc_file.file_entries, "Extracting all files...")
     
+    @property
+    def busy(self) -> bool:
+        """True while a background job is running; only one runs at a time"""
+        return self.cancel_token is not None
+    
+    def set_actions_enabled(self, enabled: bool):
+        """Enable or disable every button that starts a job or touches the archive"""
+        state = "normal" if enabled else "disabled"
+        for button in (self.browse_button, self.extract_selected_button, self.extract_all_button,
+                       self.regenerate_button):
+            button.config(state=state)
+        self.replace_button.config(state=state if len(self.selected_files) == 1 else "disabled")
+    
+    def start_job(self, status_message: str, cancellable: bool = True) -> CancellationToken:
+        """Prepare the progress bar and Cancel button for a background job, disabling the other actions"""
+        self.cancel_token = CancellationToken()
+        self.set_actions_enabled(False)
+        if cancellable:
+            self.cancel_button.config(state="normal")
+        self.status_var.set(status_message)
+        self.progress_var.set(0)
+        return self.cancel_token
+    
+    def finish_job(self):
+        """Reset the progress bar and Cancel button after a background job"""
+        self.cancel_token = None
+        self.cancel_button.config(state="disabled")
+        self.set_actions_enabled(True)
+        self.progress_var.set(0)
+    
+    def cancel_job(self):
+        """Ask the running extraction or regeneration to stop"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.status_var.set("Cancelling...")
+    
+    def report_progress(self, action: str, info: ProgressInfo):
+        """Progress callback for worker threads; forwards the update to the Tk thread"""
+        def update():
+            if self.cancel_token is None or self.cancel_token.cancelled:
+                return
+            self.progress_var.set(info.percent)
+            self.status_var.set(f"{action}: {info}")
+        self.run_on_ui(update)
+    
     def extract_files(self, files: List[FileEntry], status_message: str):
         """Extract specified files"""
+        if self.busy:
+            return
         output_dir = filedialog.askdirectory(title="Select Output Directory")
         if not output_dir:
             return
         
+        cancel_token = self.start_job(status_message)
+        
         def extract_thread():
             try:
-                self.status_var.set(status_message)
-                self.progress_var.set(0)
-                
-                success_count, total_count = self.extractor.extract_selected_files(files, output_dir)
-                
-                self.progress_var.set(100)
-                
-                if success_count == total_count:
-                    messagebox.showinfo("Success", f"Successfully extracted {success_count} files to:\n{output_dir}")
-                    self.status_var.set(f"Extracted {success_count} files successfully")
-                else:
-                    messagebox.showwarning("Partial Success", 
-                                        f"Extracted {success_count} out of {total_count} files to:\n{output_dir}")
-                    self.status_var.set(f"Extracted {success_count}/{total_count} files")
-                
+                result = self.extractor.extract_files_parallel(
+                    files, output_dir,
+                    progress_callback=lambda info: self.report_progress("Extracting", info),
+                    cancel_token=cancel_token)
+                self.run_on_ui(self.on_extract_done, result, output_dir)
             except Exception as e:
-                messagebox.showerror("Error", f"Extraction failed:\n{str(e)}")
-                self.status_var.set("Extraction failed")
-            finally:
-                self.progress_var.set(0)
+                self.run_on_ui(self.on_job_failed, "Extraction", e)
         
         thread = threading.Thread(target=extract_thread, daemon=True)
         thread.start()
+    
+    def on_extract_done(self, result: ExtractionResult, output_dir: str):
+        """Report the outcome of an extraction"""
+        self.finish_job()
+        success_count, total_count = result.success_count, result.total_count
+        
+        if result.cancelled:
+            messagebox.showwarning("Cancelled", f"Extraction cancelled after {success_count} of {total_count} files")
+            self.status_var.set(f"Extraction cancelled ({success_count}/{total_count} files)")
+        elif success_count == total_count:
+            messagebox.showinfo("Success", f"Successfully extracted {success_count} files to:\n{output_dir}")
+            self.status_var.set(f"Extracted {success_count} files successfully "
+                                f"({result.mb_per_second:.1f} MB/s, {result.files_per_second:.0f} files/s)")
+        else:
+            messagebox.showwarning("Partial Success", 
+                                f"Extracted {success_count} out of {total_count} files to:\n{output_dir}")
+            self.status_var.set(f"Extracted {success_count}/{total_count} files")
+    
+    def on_job_failed(self, action: str, error: Exception):
+        """Report a background job that raised"""
+        self.finish_job()
+        messagebox.showerror("Error", f"{action} failed:\n{str(error)}")
+        self.status_var.set(f"{action} failed")
 
     def replace_file(self):
         """Replace a file in the ARC file"""
+        if self.busy:
+            return
         if not self.arc_file:
             messagebox.showwarning("Warning", "No ARC file loaded")
             return
@@ -259,6 +429,8 @@ class ArcUnpackerGUI:
         
     def regenerate(self):
         """Regenerate the ARC file"""
+        if self.busy:
+            return
         if not self.arc_file:
             messagebox.showwarning("Warning", "No ARC file loaded")
             return
@@ -272,27 +444,34 @@ class ArcUnpackerGUI:
         if not output_path:
             return
         
+        cancel_token = self.start_job("Regenerating ARC file...")
+        
         def regenerate_thread():
             try:
-                self.status_var.set("Regenerating ARC file...")
-                self.progress_var.set(50)
-                
-                success = self.extractor.regenerate_arc_file(output_path)
-                
-                self.progress_var.set(100)
-                
-                if success:
-                    messagebox.showinfo("Success", f"ARC file regenerated successfully:\n{output_path}")
-                    self.status_var.set("ARC file regenerated successfully")
-                else:
-                    messagebox.showerror("Error", "Failed to regenerate ARC file")
-                    self.status_var.set("Regeneration failed")
-                
+                success = self.extractor.regenerate_arc_file(
+                    output_path,
+                    progress_callback=lambda info: self.report_progress("Regenerating", info),
+                    cancel_token=cancel_token)
+                self.run_on_ui(self.on_regenerate_done, success, cancel_token.cancelled, output_path)
             except Exception as e:
-                messagebox.showerror("Error", f"Regeneration failed:\n{str(e)}")
-                self.status_var.set("Regeneration failed")
-            finally:
-                self.progress_var.set(0)
+                self.run_on_ui(self.on_job_failed, "Regeneration", e)
         
         thread = threading.Thread(target=regenerate_thread, daemon=True)
-        thread.start()
\ No newline at end of file
+        thread.start()
+    
+    def on_regenerate_done(self, success: bool, cancelled: bool, output_path: str):
+        """Report the outcome of a regeneration"""
+        self.finish_job()
+        
+        if self.extractor.arc_file is not self.arc_file:
+            # The loaded archive was regenerated over and reopened
+            self.on_arc_file_loaded(output_path, self.extractor.arc_file)
+        
+        if success:
+            messagebox.showinfo("Success", f"ARC file regenerated successfully:\n{output_path}")
+            self.status_var.set("ARC file regenerated successfully")
+        elif cancelled:
+            self.status_var.set("Regeneration cancelled")
+        else:
+            messagebox.showerror("Error", "Failed to regenerate ARC file")
+            self.status_var.set("Regeneration failed")
@@ -0,0 +1,57 @@
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Library code logs through this logger and stays silent unless the application
+# configures logging (see configure_logging).
+logger = logging.getLogger('dlarc')
+logger.addHandler(logging.NullHandler())
+
+class Instrumentation:
+    """Thread-safe per-phase timers and event counters for the archive tooling
+
+    Phases in use: directory_scan, block_validation, extraction, regeneration, compression.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and add it to the phase's total"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def export(self) -> Dict[str, Dict]:
+        """Snapshot of all timers (in seconds) and counters"""
+        with self._lock:
+            return {'timers': dict(self.timers), 'counters': dict(self.counters)}
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+instrumentation = Instrumentation()
+
+def configure_logging(level: int = logging.INFO, stream=sys.stderr):
+    """Send DLARC log records to stream; for applications, not for library code"""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level)
@@ -1,8 +1,23 @@
+import asyncio
+import fnmatch
+import io
+import logging
+import mmap
+import multiprocessing
+import os
 import struct
-from typing import List, Tuple, Optional
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Set, Tuple, Optional, Union
+from arc_compression import RAW, compress_payload, decompress_payload, is_compressed
+from arc_logging import instrumentation, logger
+from arc_progress import CancellationToken, ProgressCallback, ProgressTracker
 
 class ArcHeader:
     """ARC file header structure"""
+    SIZE = 16
+
     def __init__(self, signature: bytes, magic: int):
         self.signature = signature
         self.magic = magic
@@ -14,11 +29,23 @@ class ArcHeader:
         magic = struct.unpack('<I', data[offset+12:offset+16])[0]
         return cls(signature, magic)
 
+# "DIR " signature, padding (original size of compressed payloads), magic, category,
+# two timestamps, size, address
+_ENTRY_STRUCT = struct.Struct('<4sIIIQQII')
+# "DAT " signature, padding (compression tag), magic
+_BLOCK_STRUCT = struct.Struct('<4s4sI')
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Payloads smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 256
+
 class FileEntry:
     """File entry structure in ARC file"""
+    HEADER_SIZE = _ENTRY_STRUCT.size
+
     def __init__(self, signature: bytes, magic: int, category: int, 
                  timestamp1: int, timestamp2: int, file_size: int, 
-                 file_addr: int, file_name: str):
+                 file_addr: int, file_name: str, offset: int = 0, original_size: int = 0):
         self.signature = signature
         self.magic = magic
         self.category = category
@@ -27,6 +54,9 @@ class FileEntry:
         self.file_size = file_size
         self.file_addr = file_addr
         self.file_name = file_name
+        self.offset = offset
+        # Uncompressed size when the payload is compressed, 0 otherwise
+        self.original_size = original_size
 
     def __str__(self):
         return f"FileEntry(magic={{0x{self.magic:08X}}}, category={{0x{self.category:08X}}}, file_size={{0x{self.file_size:08X}}}, file_addr={{0x{self.file_addr:08X}}}, file_name={self.file_name})"
@@ -34,156 +64,529 @@ class FileEntry:
     @classmethod
     def from_bytes(cls, data: bytes, offset: int) -> Tuple['FileEntry', int]:
         """Parse file entry from binary data, returns (FileEntry, next_offset)"""
-        signature = data[offset:offset+4]
-        
-        magic = struct.unpack('<I', data[offset+8:offset+12])[0]
-        category = struct.unpack('<I', data[offset+12:offset+16])[0]
-        
-        timestamp1 = struct.unpack('<Q', data[offset+16:offset+24])[0]
-        timestamp2 = struct.unpack('<Q', data[offset+24:offset+32])[0]
-        
-        size_raw = data[offset+32:offset+36]
-        addr_raw = data[offset+36:offset+40]
+        (signature, original_size, magic, category, timestamp1, timestamp2,
+         file_size, file_addr) = _ENTRY_STRUCT.unpack_from(data, offset)
         
-        file_size = int.from_bytes(size_raw, byteorder='little')
-        file_addr = int.from_bytes(addr_raw, byteorder='little')
-        
-        name_start = offset + 40
-        name_end = name_start
-        while name_end < len(data) and data[name_end] != 0:
-            name_end += 1
+        name_start = offset + _ENTRY_STRUCT.size
+        name_end = data.find(b'\0', name_start)
+        if name_end == -1:
+            name_end = len(data)
         
         file_name = data[name_start:name_end].decode('shift_jis', errors='ignore')
         
         next_offset = name_end + 2
         
         return cls(signature, magic, category, timestamp1, timestamp2, 
-                  file_size, file_addr, file_name), next_offset
+                  file_size, file_addr, file_name, offset, original_size), next_offset
     
 class DataBlock:
     """Data block structure in ARC file"""
-    def __init__(self, signature: bytes, magic: int, data: bytes):
+    HEADER_SIZE = 16
+
+    def __init__(self, signature: bytes, magic: int, data: Union[bytes, memoryview],
+                 reserved: bytes = b'\x00' * 4, offset: int = 0, compression: bytes = RAW):
         self.signature = signature
         self.magic = magic
+        self.reserved = reserved
+        self.offset = offset
+        self.compression = compression
         self.data = data
 
     def __str__(self):
-        return f"DataBlock()"
+        return f"DataBlock(offset={{0x{self.offset:08X}}}, size={{0x{self.size:08X}}})"
+
+    @property
+    def data(self) -> Union[bytes, memoryview]:
+        """Payload of the block; read from source_path on every access when it is file-backed"""
+        if self._data is None and self.source_path is not None:
+            with open(self.source_path, 'rb') as f:
+                return f.read()
+        return self._data
+
+    @data.setter
+    def data(self, value: Union[bytes, memoryview]):
+        self._data = value
+        self.source_path = None
+
+    @property
+    def size(self) -> int:
+        if self._data is None and self.source_path is not None:
+            return os.path.getsize(self.source_path)
+        return len(self._data)
+
+    def set_source_file(self, path: str):
+        """Back the payload by a file on disk instead of holding it in memory"""
+        self._data = None
+        self.source_path = path
     
     @classmethod
-    def from_bytes(cls, data: bytes, offset: int) -> Tuple['DataBlock', int]:
-        """Parse data block from binary data, returns (DataBlock, next_offset)"""
-        signature = data[offset:offset+4]
-        magic = struct.unpack('<I', data[offset+8:offset+12])[0]
-        data = data[offset+12:]
-        return cls(signature, magic, data), offset + len(data)
+    def from_bytes(cls, data: Union[bytes, memoryview], offset: int, size: int) -> Tuple['DataBlock', int]:
+        """Parse data block from binary data without copying the payload, returns (DataBlock, next_offset)"""
+        signature, compression, magic = _BLOCK_STRUCT.unpack_from(data, offset)
+        reserved = bytes(data[offset+12:offset+16])
+        payload_start = offset + cls.HEADER_SIZE
+        payload = memoryview(data)[payload_start:payload_start + size]
+        return cls(signature, magic, payload, reserved, offset, compression), payload_start + size
 
 class ArcFile:
     """Complete ARC file structure"""
-    def __init__(self, header: ArcHeader, file_entries: List[FileEntry], data_blocks: List[DataBlock], raw_data: bytes):
+    def __init__(self, header: ArcHeader, file_entries: List[FileEntry], data_blocks: Optional[List[DataBlock]],
+                 raw_data: Union[bytes, mmap.mmap], file_path: Optional[str] = None):
         self.header = header
         self.file_entries = file_entries
-        self.data_blocks = data_blocks
         self.raw_data = raw_data
-    
+        self.file_path = file_path
+        self.is_mapped = isinstance(raw_data, mmap.mmap)
+        self._view = memoryview(raw_data)
+        self._handle = None
+        self.parse_time = 0.0
+        # Data blocks are materialized on first access, aligned with file_entries
+        self._blocks: List[Optional[DataBlock]] = (list(data_blocks) if data_blocks is not None
+                                                  else [None] * len(file_entries))
+        self._positions: Dict[int, int] = {}
+        self._names: Dict[str, int] = {}
+        self._categories: Dict[int, List[int]] = {}
+        self._build_index()
+        # Where each payload lives in raw_data; entries are relocated on replace
+        self._sources: List[Tuple[int, int]] = [(entry.file_addr, entry.file_size) for entry in file_entries]
+        # Blocks passed in by the caller carry their own payload rather than pointing into raw_data
+        self._replaced: Set[int] = set(range(len(file_entries))) if data_blocks is not None else set()
+        self._sequential_depth = 0
+
+    def __enter__(self) -> 'ArcFile':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     @classmethod
-    def parse(cls, file_path: str) -> 'ArcFile':
-        """Parse complete ARC file from disk"""
-        with open(file_path, 'rb') as f:
-            data = f.read()
+    def parse(cls, file_path: str, use_mmap: bool = False) -> 'ArcFile':
+        """Parse complete ARC file from disk
+
+        With use_mmap the archive is memory-mapped instead of read into memory, and
+        data blocks and get_file_data() hand out zero-copy views into the mapping.
+        """
+        handle = None
+        if use_mmap:
+            handle = open(file_path, 'rb')
+            try:
+                data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception:
+                handle.close()
+                raise
+        else:
+            with open(file_path, 'rb') as f:
+                data = f.read()
         
+        start_time = time.perf_counter()
         header = ArcHeader.from_bytes(data, 0)
+        view = memoryview(data)
         
-        file_entries = []
-        data_blocks = []
-        offset = 16  
-        while offset < len(data) - 4:
-            if data[offset:offset+4] == b'DAT ':
-                break
-            
-            if data[offset:offset+4] == b'DIR ':
+        file_entries = list(cls._walk_directory(data))
+        if logger.isEnabledFor(logging.DEBUG):
+            for entry in file_entries:
+                logger.debug("%s", entry)
+        
+        arc_file = cls(header, file_entries, None, data, file_path)
+        arc_file._view = view
+        arc_file._handle = handle
+        arc_file.parse_time = time.perf_counter() - start_time
+        
+        instrumentation.add_time('directory_scan', arc_file.parse_time)
+        instrumentation.count('entries_parsed', len(file_entries))
+        logger.info("Parsed %d entries from %s in %.1f ms", len(file_entries), file_path, arc_file.parse_time * 1000)
+        return arc_file
+
+    @staticmethod
+    def _walk_directory(data: Union[bytes, mmap.mmap]):
+        """Yield the DIR entries of the archive, jumping from one entry to the next"""
+        offset = ArcHeader.SIZE
+        end = len(data) - 4
+        while offset < end:
+            signature = data[offset:offset+4]
+            if signature == b'DIR ':
                 entry, next_offset = FileEntry.from_bytes(data, offset)
-                file_entries.append(entry)
-                print(entry)
+                yield entry
+                # The name terminator is usually followed by one padding byte,
+                # but tolerate entries written without it.
                 offset = next_offset - 1
+                if data[offset:offset+4] not in (b'DIR ', b'DAT '):
+                    offset = next_offset
+            elif signature == b'DAT ':
+                break
+            else:
+                # Unexpected bytes between entries: resynchronise on the next
+                # signature instead of stepping one byte at a time.
+                next_dir = data.find(b'DIR ', offset + 1)
+                next_dat = data.find(b'DAT ', offset + 1)
+                if next_dir == -1 or (next_dat != -1 and next_dat < next_dir):
+                    break
+                offset = next_dir
 
-                dataBlock = data[entry.file_addr-16:entry.file_addr + entry.file_size]
-                print(dataBlock[0:4])
+    def close(self):
+        """Release the memory mapping (if any) backing this archive"""
+        if not self.is_mapped:
+            return
+        for block in self._blocks:
+            if block is not None and isinstance(block._data, memoryview):
+                block._data.release()
+        self._release_mapping(self.raw_data, self._view)
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+    
+    @staticmethod
+    def _release_mapping(mapping: mmap.mmap, view: memoryview):
+        try:
+            view.release()
+            mapping.close()
+        except BufferError:
+            # Views handed out by get_file_data() are still alive; the mapping
+            # is released once they are garbage collected.
+            pass
 
-                if dataBlock[0:4] == b'DAT ':
-                    block, next_offset = DataBlock.from_bytes(dataBlock, 0)
-                    print(block)
-                    data_blocks.append(block)
-                else:
-                    print("Warning: Data block not valid")
-            else:
-                offset += 1
-        
-        return cls(header, file_entries, data_blocks, data)
+    def _remap(self):
+        """Map the archive again after it grew on disk"""
+        old_mapping, old_view = self.raw_data, self._view
+        self.raw_data = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self.raw_data)
+        self._release_mapping(old_mapping, old_view)
     
-    def get_file_data(self, file_entry: FileEntry) -> Optional[bytes]:
-        """Extract file data for a given file entry using file_addr and file_size"""
-        if (file_entry.file_addr + file_entry.file_size <= len(self.raw_data)):
-            return self.raw_data[file_entry.file_addr:file_entry.file_addr + file_entry.file_size]
+    @property
+    def data_blocks(self) -> List[DataBlock]:
+        """All valid data blocks, materializing any that were not loaded yet"""
+        blocks = []
+        for i in range(len(self.file_entries)):
+            block = self.get_data_block(i)
+            if block is not None:
+                blocks.append(block)
+        return blocks
+
+    def _build_index(self):
+        """Index entries by identity, name and category"""
+        self._positions = {id(entry): i for i, entry in enumerate(self.file_entries)}
+        self._names = {}
+        self._categories = {}
+        for i, entry in enumerate(self.file_entries):
+            # Keep the first entry when a name is duplicated, like a linear search would
+            self._names.setdefault(entry.file_name, i)
+            self._categories.setdefault(entry.category, []).append(i)
+
+    def index_of(self, file_entry: FileEntry) -> Optional[int]:
+        """Position of a file entry in this archive, or None if it does not belong to it"""
+        return self._positions.get(id(file_entry))
+
+    def index_of_name(self, file_name: str) -> Optional[int]:
+        """Position of the entry called file_name, or None if there is none"""
+        return self._names.get(file_name)
+
+    def find_entry(self, file_name: str) -> Optional[FileEntry]:
+        """Look up an entry by its name (path inside the archive)"""
+        index = self._names.get(file_name)
+        return self.file_entries[index] if index is not None else None
+
+    def find_entries(self, pattern: str) -> List[FileEntry]:
+        """All entries whose name matches a glob pattern such as 'CG/*.bmp', duplicated names included"""
+        if not any(c in pattern for c in '*?['):
+            if pattern not in self._names:
+                return []
+            return [entry for entry in self.file_entries if entry.file_name == pattern]
+        return [entry for entry in self.file_entries if fnmatch.fnmatchcase(entry.file_name, pattern)]
+
+    @property
+    def has_pending_changes(self) -> bool:
+        """True once payloads were replaced or compressed in memory and not written to disk yet"""
+        return bool(self._replaced)
+
+    def stored_span(self, index: int) -> Tuple[int, int]:
+        """(file_addr, file_size) of an entry's payload in the archive on disk
+
+        Unlike the FileEntry fields, which replacements and write_to() move to the
+        layout of the archive written next.
+        """
+        return self._sources[index]
+
+    def entries_by_category(self, category: int) -> List[FileEntry]:
+        """All entries with the given category field"""
+        return [self.file_entries[i] for i in self._categories.get(category, [])]
+
+    def get_data_block(self, index: int) -> Optional[DataBlock]:
+        """Return the data block of the entry at index, loading and validating it on first access"""
+        block = self._blocks[index]
+        if block is None:
+            start_time = time.perf_counter()
+            file_addr, file_size = self._sources[index]
+            block_offset = file_addr - DataBlock.HEADER_SIZE
+            if (block_offset < 0 or file_addr + file_size > len(self.raw_data)
+                    or self.raw_data[block_offset:block_offset+4] != b'DAT '):
+                logger.warning("Data block not valid for %s", self.file_entries[index].file_name)
+                instrumentation.count('blocks_invalid')
+                return None
+            block, _ = DataBlock.from_bytes(self._view, block_offset, file_size)
+            self._blocks[index] = block
+            instrumentation.add_time('block_validation', time.perf_counter() - start_time)
+            instrumentation.count('blocks_loaded')
+        return block
+
+    def get_file_data(self, file_entry: FileEntry) -> Optional[Union[bytes, memoryview]]:
+        """Extract file data for a given file entry using file_addr and file_size
+
+        Returns a zero-copy memoryview when the archive is memory-mapped, and the
+        decompressed bytes for compressed payloads.
+        """
+        index = self.index_of(file_entry)
+        stored = self.get_stored_data(file_entry)
+        if stored is None or not file_entry.original_size or index is None:
+            return stored
+        block = self.get_data_block(index)
+        if block is None or not is_compressed(block.compression):
+            return stored
+        return decompress_payload(block.compression, stored, file_entry.original_size)
+
+    def get_stored_data(self, file_entry: FileEntry) -> Optional[Union[bytes, memoryview]]:
+        """Payload of an entry as stored in the archive, without decompressing it"""
+        index = self.index_of(file_entry)
+        if index is not None and self._blocks[index] is not None:
+            data = self._blocks[index].data
+            # A view of its own, so callers releasing it leave the block's view intact
+            return data[:] if isinstance(data, memoryview) else data
+        file_addr, file_size = (self._sources[index] if index is not None
+                                else (file_entry.file_addr, file_entry.file_size))
+        if (file_addr + file_size <= len(self.raw_data)):
+            if self.is_mapped:
+                return self._view[file_addr:file_addr + file_size]
+            return self.raw_data[file_addr:file_addr + file_size]
         return None
     
+    def iter_entries(self, file_entries: Optional[List[FileEntry]] = None,
+                     chunk_size: int = COPY_CHUNK_SIZE) -> Iterator[Tuple[FileEntry, Union[bytes, memoryview]]]:
+        """Yield (FileEntry, chunk) pieces of the entries' payloads in file-offset order
+
+        The archive is walked front to back once, so consumers can process entries
+        as a pipeline. Every entry yields at least one chunk (an empty one for empty
+        files) and its chunks are consecutive. Chunks taken from the archive are
+        zero-copy views that stay valid while it is open. Entries whose payload is
+        out of bounds are logged and skipped.
+        """
+        if file_entries is None:
+            indices = range(len(self.file_entries))
+        else:
+            indices = [i for i in map(self.index_of, file_entries) if i is not None]
+        order = sorted(indices, key=lambda i: self._sources[i][0])
+        
+        with self.sequential_access():
+            yield from self._iter_ordered(order, chunk_size)
+
+    def _iter_ordered(self, order: List[int], chunk_size: int) -> Iterator[Tuple[FileEntry, Union[bytes, memoryview]]]:
+        for i in order:
+            entry = self.file_entries[i]
+            if entry.original_size and is_compressed(getattr(self.get_data_block(i), 'compression', RAW)):
+                data = memoryview(self.get_file_data(entry))
+                chunks = (data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size))
+            elif i in self._replaced:
+                chunks = self._iter_block(self._blocks[i], chunk_size)
+            else:
+                file_addr, file_size = self._sources[i]
+                if file_addr + file_size > len(self.raw_data):
+                    logger.warning("Data block not valid for %s", entry.file_name)
+                    instrumentation.count('blocks_invalid')
+                    continue
+                chunks = self._iter_range(file_addr, file_size, chunk_size)
+            
+            empty = True
+            for chunk in chunks:
+                empty = False
+                yield entry, chunk
+            if empty:
+                yield entry, b''
+
+    @contextmanager
+    def sequential_access(self):
+        """Ask for aggressive read-ahead of the mapping while the archive is walked front to back
+
+        Nested uses keep the advice until the outermost one exits, so a caller
+        can run several iter_entries() passes as one sequential read.
+        """
+        advise = self.is_mapped and hasattr(mmap, 'MADV_SEQUENTIAL')
+        if advise and not self._sequential_depth:
+            self.raw_data.madvise(mmap.MADV_SEQUENTIAL)
+        self._sequential_depth += 1
+        try:
+            yield
+        finally:
+            self._sequential_depth -= 1
+            if advise and not self._sequential_depth and not self.raw_data.closed:
+                self.raw_data.madvise(mmap.MADV_NORMAL)
+
+    async def aiter_entries(self, file_entries: Optional[List[FileEntry]] = None,
+                            chunk_size: int = COPY_CHUNK_SIZE) -> AsyncIterator[Tuple[FileEntry, Union[bytes, memoryview]]]:
+        """Asynchronous iter_entries; the next chunk is read in a worker thread while the current one is consumed"""
+        pieces = self.iter_entries(file_entries, chunk_size)
+        pending = asyncio.ensure_future(asyncio.to_thread(next, pieces, None))
+        try:
+            while True:
+                piece = await pending
+                if piece is None:
+                    break
+                pending = asyncio.ensure_future(asyncio.to_thread(next, pieces, None))
+                yield piece
+        finally:
+            # The reader thread may still be inside the generator; let it finish first
+            if not pending.done():
+                await asyncio.wait([pending])
+            pieces.close()
+
+    def _iter_range(self, offset: int, count: int, chunk_size: int) -> Iterator[memoryview]:
+        """Chunks of count bytes of the source archive starting at offset"""
+        end = offset + count
+        while offset < end:
+            yield self._view[offset:min(end, offset + chunk_size)]
+            offset += chunk_size
+
+    @staticmethod
+    def _iter_block(block: DataBlock, chunk_size: int) -> Iterator[Union[bytes, memoryview]]:
+        """Chunks of a replaced payload, read from its source file if it has one"""
+        if block.source_path is not None:
+            with open(block.source_path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        data = memoryview(block.data)
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
     def list_files(self) -> List[Tuple[str, int, int]]:
         """List all files with name, size, and address"""
         return [(entry.file_name, entry.file_size, entry.file_addr) for entry in self.file_entries]
 
     def regenerate(self) -> bytes:
         """Regenerate the ARC file and return new binary data"""
-        result = bytearray()
+        result = io.BytesIO()
+        self.write_to(result)
+        return result.getvalue()
+
+    def write_to(self, out: BinaryIO, progress_callback: Optional[ProgressCallback] = None,
+                 cancel_token: Optional[CancellationToken] = None) -> int:
+        """Stream the regenerated ARC file to a binary file object, returns bytes written
+
+        The DIR table is written first, then every DAT block in turn. Payloads that
+        were not replaced are copied straight from the source archive (in the kernel
+        where possible), so memory use does not grow with the archive size.
+        Raises OperationCancelled between blocks once cancel_token is cancelled.
+        """
+        blocks = []
+        for i, entry in enumerate(self.file_entries):
+            block = self.get_data_block(i)
+            if block is None:
+                raise ValueError(f"Data block not valid for {entry.file_name}")
+            if i in self._replaced and block.source_path is not None:
+                # The replacement file may have changed since replace_files() sized it
+                entry.file_size = block.size
+            blocks.append(block)
         
-        result.extend(self.header.signature)
-        result.extend(b'\x00' * 8)
-        result.extend(struct.pack('<I', self.header.magic))
+        names = [entry.file_name.encode('shift_jis') for entry in self.file_entries]
+        self._apply_layout(names)
         
-        for entry in self.file_entries:
-            result.extend(b'DIR ')
-            
-            result.extend(b'\x00' * 4)
-            
-            result.extend(struct.pack('<I', entry.magic))
-            result.extend(struct.pack('<I', entry.category))
-            result.extend(struct.pack('<Q', entry.timestamp1))
-            result.extend(struct.pack('<Q', entry.timestamp2))
-            
-            result.extend(struct.pack('<I', entry.file_size))
-            result.extend(struct.pack('<I', entry.file_addr))
-            
-            result.extend(entry.file_name.encode('shift_jis'))
-            result.extend(b'\x00')
+        out.write(self.header.signature)
+        out.write(b'\x00' * 8)
+        out.write(struct.pack('<I', self.header.magic))
+        written = ArcHeader.SIZE
         
-        for block in self.data_blocks:
-            result.extend(b'DAT ')
-            
-            result.extend(b'\x00' * 4)
-            
-            result.extend(struct.pack('<I', block.magic))
+        for entry, name in zip(self.file_entries, names):
+            out.write(_ENTRY_STRUCT.pack(b'DIR ', entry.original_size, entry.magic, entry.category,
+                                         entry.timestamp1, entry.timestamp2, entry.file_size, entry.file_addr))
+            out.write(name)
+            out.write(b'\x00')
+            written += _ENTRY_STRUCT.size + len(name) + 1
+        
+        out_fd = self._kernel_copy_target(out)
+        tracker = ProgressTracker(len(blocks), sum(entry.file_size for entry in self.file_entries),
+                                  progress_callback)
+        for i, block in enumerate(blocks):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            out.write(_BLOCK_STRUCT.pack(b'DAT ', block.compression, block.magic))
+            out.write(block.reserved)
             
-            result.extend(block.data)
+            if i in self._replaced:
+                if block.source_path is not None:
+                    self._copy_source_file(out, block.source_path, self.file_entries[i].file_size)
+                else:
+                    out.write(block.data)
+            else:
+                file_addr, file_size = self._sources[i]
+                self._copy_range(out, out_fd, file_addr, file_size)
+            written += DataBlock.HEADER_SIZE + self.file_entries[i].file_size
+            tracker.advance(1, self.file_entries[i].file_size)
+        
+        tracker.finish()
+        return written
+
+    @staticmethod
+    def _copy_source_file(out: BinaryIO, path: str, size: int):
+        """Copy exactly size bytes of a replacement file, which the DIR table already promised"""
+        with open(path, 'rb') as src:
+            remaining = size
+            while remaining > 0:
+                chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f"{path} shrank to {size - remaining} bytes while it was written, expected {size}")
+                out.write(chunk)
+                remaining -= len(chunk)
+            if src.read(1):
+                raise ValueError(f"{path} grew while it was written, expected {size} bytes")
+
+    def _apply_layout(self, names: List[bytes]):
+        """Assign every entry the file_addr it gets when the archive is written out"""
+        addr = ArcHeader.SIZE + sum(_ENTRY_STRUCT.size + len(name) + 1 for name in names)
+        for entry in self.file_entries:
+            entry.file_addr = addr + DataBlock.HEADER_SIZE
+            addr = entry.file_addr + entry.file_size
+
+    def _kernel_copy_target(self, out: BinaryIO) -> Optional[int]:
+        """File descriptor of out if payloads can be copied to it without going through Python"""
+        if self._handle is None or not (hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile')):
+            return None
+        try:
+            return out.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+
+    def _copy_range(self, out: BinaryIO, out_fd: Optional[int], offset: int, count: int):
+        """Copy count bytes starting at offset in the source archive to out"""
+        if out_fd is not None and count > 0:
+            out.flush()
+            src_fd = self._handle.fileno()
+            try:
+                while count > 0:
+                    if hasattr(os, 'copy_file_range'):
+                        copied = os.copy_file_range(src_fd, out_fd, count, offset)
+                    else:
+                        copied = os.sendfile(out_fd, src_fd, offset, count)
+                    if copied == 0:
+                        break
+                    offset += copied
+                    count -= copied
+            except OSError:
+                # Not supported between these two files; finish through the mapping
+                pass
         
-        return bytes(result)
+        while count > 0:
+            chunk = min(count, COPY_CHUNK_SIZE)
+            out.write(self._view[offset:offset + chunk])
+            offset += chunk
+            count -= chunk
     
     def replace_file_data(self, file_entry: FileEntry, new_data: bytes) -> bool:
         """Replace file data and update addresses"""
         try:
-            file_index = None
-            for i, entry in enumerate(self.file_entries):
-                if entry == file_entry:
-                    file_index = i
-                    break
-            
+            file_index = self.index_of(file_entry)
             if file_index is None:
                 return False
             
-            size_difference = len(new_data) - file_entry.file_size
-            
-            file_entry.file_size = len(new_data)
-            
-            if file_index < len(self.data_blocks):
-                self.data_blocks[file_index].data = new_data
+            size_difference = self._set_payload(file_index, new_data)
             
             if size_difference != 0:
                 self._shift_subsequent_files(file_index, size_difference)
@@ -191,8 +594,175 @@ class ArcFile:
             return True
             
         except Exception as e:
-            print(f"Error replacing file data: {e}")
+            logger.error("Error replacing file data: %s", e)
             return False
+
+    def patch_in_place(self, file_entry: FileEntry, new_data: bytes) -> bool:
+        """Patch one entry directly in the archive on disk without rewriting it
+
+        The payload is overwritten where it is when it fits, otherwise a new DAT
+        block is appended at the end of the file. Either way only that entry's
+        file_size/file_addr are rewritten in the DIR table; the space left behind
+        stays dead until compact() is run. Requires a memory-mapped archive.
+        """
+        try:
+            file_index = self.index_of(file_entry)
+            if file_index is None:
+                return False
+            if not self.is_mapped:
+                logger.error("In-place patching needs the archive opened with use_mmap=True")
+                return False
+            if self._replaced:
+                logger.error("Regenerate the archive before patching it in place")
+                return False
+            
+            block = self.get_data_block(file_index)
+            file_addr, file_size = self._sources[file_index]
+            
+            with open(self.file_path, 'r+b') as f:
+                if len(new_data) <= file_size:
+                    f.seek(file_addr)
+                    f.write(new_data)
+                else:
+                    f.seek(0, os.SEEK_END)
+                    block_offset = f.tell()
+                    file_addr = block_offset + DataBlock.HEADER_SIZE
+                    if file_addr + len(new_data) > 0xFFFFFFFF:
+                        logger.error("Archive would grow past the 4 GB address limit")
+                        return False
+                    magic, reserved = (block.magic, block.reserved) if block is not None else (0, b'\x00' * 4)
+                    f.write(_BLOCK_STRUCT.pack(b'DAT ', RAW, magic))
+                    f.write(reserved)
+                    f.write(new_data)
+                if file_entry.original_size:
+                    # The new payload is stored raw
+                    f.seek(file_addr - DataBlock.HEADER_SIZE + 4)
+                    f.write(RAW)
+                    f.seek(file_entry.offset + 4)
+                    f.write(struct.pack('<I', 0))
+                
+                f.seek(file_entry.offset + 32)
+                f.write(struct.pack('<II', len(new_data), file_addr))
+            
+            file_entry.original_size = 0
+            file_entry.file_size = len(new_data)
+            file_entry.file_addr = file_addr
+            self._sources[file_index] = (file_addr, len(new_data))
+            self._blocks[file_index] = None
+            if file_addr + len(new_data) > len(self.raw_data):
+                self._remap()
+            
+            return True
+            
+        except Exception as e:
+            logger.error("Error patching file data: %s", e)
+            return False
+
+    def dead_space(self) -> int:
+        """Bytes of the archive on disk not referenced by any entry (reclaimed by compact())"""
+        names_size = sum(_ENTRY_STRUCT.size + len(entry.file_name.encode('shift_jis')) + 1
+                         for entry in self.file_entries)
+        live_size = ArcHeader.SIZE + names_size + sum(DataBlock.HEADER_SIZE + size for _, size in self._sources)
+        return max(0, len(self.raw_data) - live_size)
+
+    def compact(self) -> 'ArcFile':
+        """Rewrite the archive on disk without dead space, returns the reopened archive
+
+        This archive is closed afterwards; use the returned one instead.
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            self.write_to(f)
+        
+        use_mmap = self.is_mapped
+        self.close()
+        os.replace(temp_path, self.file_path)
+        return ArcFile.parse(self.file_path, use_mmap=use_mmap)
+
+    def replace_files(self, patch_set: Dict[str, Union[bytes, str]]) -> List[str]:
+        """Replace many entries at once, returns the names that are not in the archive
+
+        patch_set maps entry names to the new payload, either as bytes or as the path
+        of a file that is only read when the archive is written. All addresses are
+        recomputed in a single pass once every payload is in place.
+        """
+        missing = []
+        
+        for file_name, replacement in patch_set.items():
+            file_index = self._names.get(file_name)
+            if file_index is None:
+                missing.append(file_name)
+                continue
+            self._set_payload(file_index, replacement)
+        
+        self._apply_layout([entry.file_name.encode('shift_jis') for entry in self.file_entries])
+        return missing
+
+    def compress_entries(self, methods: Dict[Optional[int], str], max_workers: Optional[int] = None,
+                         min_size: int = COMPRESS_MIN_SIZE) -> int:
+        """Compress the payloads of entries whose category has a method in methods, returns bytes saved
+
+        methods maps FileEntry.category to a method from arc_compression ('zlib',
+        'lz4'); the None key applies to every other category. Payloads are
+        compressed in a pool of worker processes and only kept when they shrink.
+        The original size goes into the DIR entry's padding field and the method
+        into the DAT block's, so get_file_data() can decompress transparently.
+        """
+        candidates = []
+        for i, entry in enumerate(self.file_entries):
+            method = methods.get(entry.category, methods.get(None))
+            block = self.get_data_block(i)
+            if method is None or block is None or entry.file_size < min_size or is_compressed(block.compression):
+                continue
+            candidates.append((i, method))
+        
+        saved = 0
+        # Bound the payloads in flight instead of queueing the whole archive at once
+        batch_size = 4 * (max_workers or os.cpu_count() or 1)
+        # Spawn rather than fork: the CLI calls this from worker threads, and forking a
+        # process that runs other threads can deadlock the child
+        spawn = multiprocessing.get_context('spawn')
+        with instrumentation.phase('compression'), ProcessPoolExecutor(max_workers=max_workers,
+                                                                        mp_context=spawn) as pool:
+            for start in range(0, len(candidates), batch_size):
+                batch = candidates[start:start + batch_size]
+                payloads = [bytes(self.get_file_data(self.file_entries[i])) for i, _ in batch]
+                results = pool.map(compress_payload, [method for _, method in batch], payloads)
+                for (i, _), payload, (tag, compressed) in zip(batch, payloads, results):
+                    if len(compressed) >= len(payload):
+                        continue
+                    entry = self.file_entries[i]
+                    block = self._blocks[i]
+                    block.data = compressed
+                    block.compression = tag
+                    self._replaced.add(i)
+                    entry.original_size = len(payload)
+                    entry.file_size = len(compressed)
+                    saved += len(payload) - len(compressed)
+                    instrumentation.count('entries_compressed')
+        
+        self._apply_layout([entry.file_name.encode('shift_jis') for entry in self.file_entries])
+        return saved
+
+    def _set_payload(self, file_index: int, replacement: Union[bytes, str]) -> int:
+        """Swap in a new payload (bytes or file path) for an entry, returns the size difference"""
+        file_entry = self.file_entries[file_index]
+        block = self.get_data_block(file_index)
+        if block is None:
+            block = DataBlock(b'DAT ', 0, b'')
+            self._blocks[file_index] = block
+        
+        if isinstance(replacement, str):
+            block.set_source_file(replacement)
+        else:
+            block.data = replacement
+        block.compression = RAW
+        file_entry.original_size = 0
+        self._replaced.add(file_index)
+        
+        size_difference = block.size - file_entry.file_size
+        file_entry.file_size = block.size
+        return size_difference
     
     def _shift_subsequent_files(self, start_index: int, size_difference: int):
         """Shift file addresses for files after the specified index"""
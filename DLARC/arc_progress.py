@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Callable, Optional
+
+class OperationCancelled(Exception):
+    """Raised inside a long-running archive operation once it has been cancelled"""
+
+class CancellationToken:
+    """Cooperative cancellation flag shared between a caller and a long-running job"""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop as soon as possible"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+class ProgressInfo:
+    """Snapshot of how far an extraction or regeneration has got"""
+    def __init__(self, files_done: int, files_total: int, bytes_done: int, bytes_total: int, elapsed: float):
+        self.files_done = files_done
+        self.files_total = files_total
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total
+        self.elapsed = elapsed
+
+    def __str__(self):
+        eta = f"{self.eta:.0f}s" if self.eta is not None else "?"
+        return (f"{self.files_done}/{self.files_total} files, "
+                f"{self.mb_per_second:.1f} MB/s, ETA {eta}")
+
+    @property
+    def percent(self) -> float:
+        """Completion in percent, by bytes when sizes are known, by files otherwise"""
+        if self.bytes_total > 0:
+            return 100.0 * self.bytes_done / self.bytes_total
+        if self.files_total > 0:
+            return 100.0 * self.files_done / self.files_total
+        return 100.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_done / (1024 * 1024) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds remaining, or None before anything has been measured"""
+        if self.elapsed <= 0 or self.percent <= 0:
+            return None
+        return self.elapsed * (100.0 - self.percent) / self.percent
+
+ProgressCallback = Callable[[ProgressInfo], None]
+
+class ProgressTracker:
+    """Thread-safe progress counter that reports to a callback at a bounded rate"""
+    def __init__(self, files_total: int, bytes_total: int, callback: Optional[ProgressCallback] = None,
+                 interval: float = 0.1):
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.callback = callback
+        self.interval = interval
+        self.files_done = 0
+        self.bytes_done = 0
+        self.start_time = time.perf_counter()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def advance(self, files: int = 0, nbytes: int = 0):
+        """Record finished work and report it if the interval has passed"""
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += nbytes
+            now = time.perf_counter()
+            if self.callback is None or now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            info = self._snapshot(now)
+        self.callback(info)
+
+    def finish(self):
+        """Report the final state regardless of the interval"""
+        if self.callback is not None:
+            with self._lock:
+                info = self._snapshot(time.perf_counter())
+            self.callback(info)
+
+    def _snapshot(self, now: float) -> ProgressInfo:
+        return ProgressInfo(self.files_done, self.files_total, self.bytes_done, self.bytes_total,
+                            now - self.start_time)
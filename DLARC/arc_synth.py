@@ -0,0 +1,62 @@
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+from arc_parser import ArcFile, ArcHeader, DataBlock, FileEntry
+
+# Directory, extension and category of the kinds of assets found in the game's archives
+ASSET_KINDS: List[Tuple[str, str, int]] = [
+    ('CG', 'bmp', 1),
+    ('BG', 'bmp', 1),
+    ('SE', 'wav', 2),
+    ('VOICE', 'ogg', 2),
+    ('SCRIPT', 'txt', 3),
+]
+
+# Words used to build Shift-JIS file names
+NAME_WORDS = ['背景', '立ち絵', '音声', '効果音', '教室', '夕焼け', '笑顔', 'ｶﾀｶﾅ', 'シナリオ', '朝']
+
+def _fixed(rng: random.Random, mean: int) -> int:
+    return mean
+
+def _uniform(rng: random.Random, mean: int) -> int:
+    return rng.randint(0, 2 * mean)
+
+def _lognormal(rng: random.Random, mean: int) -> int:
+    # Mostly small files with a long tail of large ones, like real asset archives
+    return min(int(rng.lognormvariate(0, 1.2) * mean / 2.05), 64 * mean)
+
+SIZE_DISTRIBUTIONS: Dict[str, Callable[[random.Random, int], int]] = {
+    'fixed': _fixed,
+    'uniform': _uniform,
+    'lognormal': _lognormal,
+}
+
+def synthetic_name(rng: random.Random, index: int) -> Tuple[str, int]:
+    """Unique Shift-JIS encodable name and category for the entry at index"""
+    directory, extension, category = ASSET_KINDS[index % len(ASSET_KINDS)]
+    word = rng.choice(NAME_WORDS)
+    return f"{directory}/{word}{index:06d}.{extension}", category
+
+def build_synthetic_archive(entry_count: int, mean_size: int = 64 * 1024, distribution: str = 'lognormal',
+                            seed: int = 0) -> ArcFile:
+    """In-memory ARC archive with entry_count random entries, ready to be written out"""
+    rng = random.Random(seed)
+    sizes = SIZE_DISTRIBUTIONS[distribution]
+    timestamp = int(time.time()) * 10_000_000
+
+    file_entries = []
+    data_blocks = []
+    for i in range(entry_count):
+        file_name, category = synthetic_name(rng, i)
+        payload = rng.randbytes(max(0, sizes(rng, mean_size)))
+        file_entries.append(FileEntry(b'DIR ', 7, category, timestamp, timestamp, len(payload), 0, file_name))
+        data_blocks.append(DataBlock(b'DAT ', 9, payload))
+
+    return ArcFile(ArcHeader(b'ARC\x00', 0x10), file_entries, data_blocks, b'')
+
+def write_synthetic_archive(output_path: str, entry_count: int, mean_size: int = 64 * 1024,
+                            distribution: str = 'lognormal', seed: int = 0) -> int:
+    """Write a synthetic archive with the regular ARC writer, returns its size in bytes"""
+    arc_file = build_synthetic_archive(entry_count, mean_size, distribution, seed)
+    with open(output_path, 'wb') as f:
+        return arc_file.write_to(f)
@@ -0,0 +1,153 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from arc_parser import ArcFile, ArcHeader, DataBlock, FileEntry
+from file_extractor import content_hash
+
+class EntryCheck:
+    """Verification outcome for a single DIR/DAT pair"""
+    def __init__(self, index: int, file_name: str, problems: List[str], checksum: Optional[str] = None):
+        self.index = index
+        self.file_name = file_name
+        self.problems = problems
+        self.checksum = checksum
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def to_dict(self) -> Dict:
+        return {'index': self.index, 'name': self.file_name, 'ok': self.ok,
+                'problems': self.problems, 'checksum': self.checksum}
+
+class VerificationResult:
+    """Structured result of verifying an ARC archive
+
+    problems make the archive fail; warnings (such as duplicate names, which the
+    game's archives are allowed to have) are only reported.
+    """
+    def __init__(self, file_path: Optional[str], entries: List[EntryCheck], problems: List[str], elapsed: float,
+                 warnings: Optional[List[str]] = None):
+        self.file_path = file_path
+        self.entries = entries
+        self.problems = problems
+        self.elapsed = elapsed
+        self.warnings = warnings or []
+
+    def __str__(self):
+        return (f"VerificationResult({'OK' if self.ok else 'FAILED'}, {len(self.entries)} entries, "
+                f"{len(self.failed_entries)} bad, {len(self.problems)} archive problems, "
+                f"{len(self.warnings)} warnings, {self.elapsed:.2f}s)")
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems and not self.failed_entries
+
+    @property
+    def failed_entries(self) -> List[EntryCheck]:
+        return [entry for entry in self.entries if not entry.ok]
+
+    def to_dict(self, include_entries: bool = False) -> Dict:
+        result = {
+            'ok': self.ok,
+            'file_count': len(self.entries),
+            'problems': self.problems,
+            'warnings': self.warnings,
+            'failed': [entry.to_dict() for entry in self.failed_entries],
+            'verify_time': self.elapsed,
+        }
+        if include_entries:
+            result['entries'] = [entry.to_dict() for entry in self.entries]
+        return result
+
+class ArcVerifier:
+    """Checks the DIR table and DAT blocks of a parsed ARC archive
+
+    Every entry is checked for a DAT signature in front of its payload and for a
+    payload inside the file and past the DIR table; the archive as a whole for
+    overlapping blocks. Duplicate names are reported as warnings. Checksums are computed on a thread
+    pool straight from the archive's (ideally memory-mapped) buffer.
+    """
+    def __init__(self, arc_file: ArcFile):
+        self.arc_file = arc_file
+
+    def verify(self, max_workers: Optional[int] = None, checksums: bool = True) -> VerificationResult:
+        """Check the archive as it is on disk; raises ValueError if it has unwritten replacements"""
+        if self.arc_file.has_pending_changes:
+            raise ValueError("The archive has replacements that are not written yet; regenerate it and verify the output")
+        start_time = time.perf_counter()
+        entries = self.arc_file.file_entries
+        directory_end = self._directory_end()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            checks = list(pool.map(lambda i: self._check_entry(i, directory_end, checksums), range(len(entries))))
+
+        problems = self._check_overlaps(checks)
+        return VerificationResult(self.arc_file.file_path, checks, problems, time.perf_counter() - start_time,
+                                  self._check_duplicates())
+
+    def _directory_end(self) -> int:
+        """Offset just past the last DIR entry"""
+        if not self.arc_file.file_entries:
+            return ArcHeader.SIZE
+        last_offset = max(entry.offset for entry in self.arc_file.file_entries)
+        name_end = self.arc_file.raw_data.find(b'\0', last_offset + FileEntry.HEADER_SIZE)
+        return name_end + 1 if name_end != -1 else len(self.arc_file.raw_data)
+
+    def _check_entry(self, index: int, directory_end: int, checksums: bool) -> EntryCheck:
+        entry = self.arc_file.file_entries[index]
+        raw_data = self.arc_file.raw_data
+        problems = []
+        # The DIR fields may already describe the next layout (see ArcFile.stored_span)
+        file_addr, file_size = self.arc_file.stored_span(index)
+
+        block_offset = file_addr - DataBlock.HEADER_SIZE
+        if block_offset < directory_end:
+            problems.append(f"data block at 0x{block_offset:08X} starts inside the DIR table")
+        elif raw_data[block_offset:block_offset+4] != b'DAT ':
+            problems.append(f"no DAT signature at 0x{block_offset:08X}")
+
+        if file_addr + file_size > len(raw_data):
+            problems.append(f"payload ends at 0x{file_addr + file_size:08X}, "
+                            f"past the end of the archive (0x{len(raw_data):08X})")
+
+        checksum = None
+        if checksums and not problems:
+            try:
+                checksum = content_hash(self.arc_file.get_file_data(entry))
+            except Exception as e:
+                problems.append(f"payload cannot be decompressed: {e}")
+        return EntryCheck(index, entry.file_name, problems, checksum)
+
+    def _check_duplicates(self) -> List[str]:
+        """Names used by more than one entry; legal, but only the first is found by name"""
+        seen: Dict[str, int] = {}
+        warnings = []
+        for i, entry in enumerate(self.arc_file.file_entries):
+            if entry.file_name in seen:
+                warnings.append(f"duplicate name {entry.file_name} (entries {seen[entry.file_name]} and {i})")
+            else:
+                seen[entry.file_name] = i
+        return warnings
+
+    def _check_overlaps(self, checks: List[EntryCheck]) -> List[str]:
+        entries = self.arc_file.file_entries
+        # Blocks already out of bounds would report an overlap with everything after them
+        spans = []
+        for i in range(len(entries)):
+            if checks[i].ok:
+                file_addr, file_size = self.arc_file.stored_span(i)
+                spans.append((file_addr - DataBlock.HEADER_SIZE, file_addr + file_size, i))
+        spans.sort()
+        problems = []
+        # Compare each block with the furthest-reaching block before it
+        reach_end, reach_index = -1, -1
+        for start, end, j in spans:
+            if start < reach_end:
+                i = reach_index
+                problems.append(f"data blocks of {entries[i].file_name} and {entries[j].file_name} overlap")
+                checks[i].problems.append(f"overlaps {entries[j].file_name}")
+                checks[j].problems.append(f"overlaps {entries[i].file_name}")
+            if end > reach_end:
+                reach_end, reach_index = end, j
+        return problems
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Benchmarks for the archive layer on synthetic ARC archives
+
+Every case runs in a fresh process so its peak RSS (peak traced heap where the
+resource module is missing, as on Windows) is its own. Results are printed
+as JSON; with --baseline the run fails if a case got slower than the tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+from arc_parser import ArcFile
+from arc_synth import SIZE_DISTRIBUTIONS, write_synthetic_archive
+from file_extractor import ArcExtractor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory falls back to the Python heap traced by tracemalloc
+    resource = None
+
+def bench_parse(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path) as arc_file:
+        return {'entries': len(arc_file.file_entries)}
+
+def bench_parse_mmap(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        return {'entries': len(arc_file.file_entries)}
+
+def bench_get_file_data(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        total = 0
+        for entry in arc_file.file_entries:
+            data = arc_file.get_file_data(entry)
+            total += len(data)
+            data.release()
+        return {'bytes': total}
+
+def bench_regenerate(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        with open(os.path.join(work_dir, 'regenerated.arc'), 'wb') as f:
+            return {'bytes': arc_file.write_to(f)}
+
+def bench_replace_file_data(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        entries = arc_file.file_entries[::max(1, len(arc_file.file_entries) // 100)]
+        for entry in entries:
+            arc_file.replace_file_data(entry, b'\x00' * (entry.file_size + 1))
+        return {'replaced': len(entries)}
+
+def bench_extract_all_files(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        extractor = ArcExtractor(arc_file)
+        result = extractor.extract_files_parallel(arc_file.file_entries, os.path.join(work_dir, 'extracted'))
+        return {'bytes': result.bytes_written, 'mb_per_second': result.mb_per_second,
+                'files_per_second': result.files_per_second}
+
+def bench_extract_streaming(archive_path: str, work_dir: str) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        extractor = ArcExtractor(arc_file)
+        result = extractor.extract_streaming(arc_file.file_entries, os.path.join(work_dir, 'extracted'))
+        return {'bytes': result.bytes_written, 'mb_per_second': result.mb_per_second,
+                'files_per_second': result.files_per_second}
+
+CASES: Dict[str, Callable[[str, str], Dict]] = {
+    'parse': bench_parse,
+    'parse_mmap': bench_parse_mmap,
+    'get_file_data': bench_get_file_data,
+    'regenerate': bench_regenerate,
+    'replace_file_data': bench_replace_file_data,
+    'extract_all_files': bench_extract_all_files,
+    'extract_streaming': bench_extract_streaming,
+}
+
+def run_case(name: str, archive_path: str, repeat: int) -> Dict:
+    """Run one case repeat times in this process, keeping the best time"""
+    times = []
+    if resource is None:
+        tracemalloc.start()
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix='dlarc-bench-')
+        try:
+            start_time = time.perf_counter()
+            extra = CASES[name](archive_path, work_dir)
+            times.append(time.perf_counter() - start_time)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if resource is None:
+        peak_heap = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return dict(extra, best=min(times), mean=sum(times) / len(times), peak_rss=None, peak_heap=peak_heap)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return dict(extra, best=min(times), mean=sum(times) / len(times), peak_rss=peak_rss)
+
+def describe_memory(result: Dict) -> str:
+    if result['peak_rss'] is None:
+        return f"{result['peak_heap'] / (1024 * 1024):8.1f} MB peak heap"
+    return f"{result['peak_rss'] / (1024 * 1024):8.1f} MB peak RSS"
+
+def run_isolated(function: Callable, *args):
+    """Call function in a fresh interpreter; a forked child would inherit the parent's peak RSS"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+def regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Cases that are slower than in the baseline by more than tolerance"""
+    slower = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result['best'] > previous['best'] * (1 + tolerance):
+            slower.append(f"{name}: {previous['best'] * 1000:.1f} ms -> {result['best'] * 1000:.1f} ms")
+    return slower
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--entries', type=int, default=10000, help='entries in the synthetic archive')
+    parser.add_argument('-s', '--mean-size', type=int, default=16 * 1024, help='mean payload size in bytes')
+    parser.add_argument('-d', '--distribution', choices=sorted(SIZE_DISTRIBUTIONS), default='lognormal')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-a', '--archive', help='benchmark this archive instead of a synthetic one')
+    parser.add_argument('-c', '--case', action='append', choices=list(CASES), help='only run these cases')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='also write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline (0.2 = 20%%)')
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    temp_dir = tempfile.mkdtemp(prefix='dlarc-bench-')
+    try:
+        archive_path = args.archive
+        if archive_path is None:
+            archive_path = os.path.join(temp_dir, 'synthetic.arc')
+            run_isolated(write_synthetic_archive, archive_path, args.entries, args.mean_size,
+                         args.distribution, args.seed)
+
+        results = {}
+        for name in args.case or CASES:
+            results[name] = run_isolated(run_case, name, archive_path, args.repeat)
+            print(f"{name:20} {results[name]['best'] * 1000:10.1f} ms {describe_memory(results[name])}",
+                  file=sys.stderr)
+
+        report = {
+            'archive': {'path': args.archive, 'size': os.path.getsize(archive_path), 'entries': args.entries,
+                        'mean_size': args.mean_size, 'distribution': args.distribution, 'seed': args.seed},
+            'cases': results,
+        }
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=1)
+
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                slower = regressions(results, json.load(f)['cases'], args.tolerance)
+            for line in slower:
+                print(f"Regression: {line}", file=sys.stderr)
+            return 1 if slower else 0
+        return 0
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from arc_compression import available_methods
+from arc_dedup import ContentStore, DedupExtractor
+from arc_logging import configure_logging, instrumentation
+from arc_parser import ArcFile, FileEntry
+from arc_verifier import ArcVerifier
+from file_extractor import ArcExtractor
+
+def archive_stem(archive_path: str) -> str:
+    """Name of the per-archive directory used by extract and repack"""
+    return os.path.splitext(os.path.basename(archive_path))[0]
+
+def select_entries(arc_file: ArcFile, patterns: Optional[List[str]]) -> List[FileEntry]:
+    """Entries matching any of the glob patterns, or all entries without patterns"""
+    if not patterns:
+        return list(arc_file.file_entries)
+    selected = set()
+    for pattern in patterns:
+        selected.update(arc_file.index_of(entry) for entry in arc_file.find_entries(pattern))
+    return [arc_file.file_entries[i] for i in sorted(selected)]
+
+def parse_compression(assignments: Optional[List[str]]) -> Dict[Optional[int], str]:
+    """Category -> method map from CATEGORY=METHOD arguments; '*' or a bare METHOD means every category"""
+    methods = {}
+    for assignment in assignments or []:
+        category, _, method = assignment.rpartition('=')
+        if method not in available_methods():
+            raise ValueError(f"Unknown compression method {method} (available: {', '.join(available_methods())})")
+        methods[None if category in ('', '*') else int(category, 0)] = method
+    return methods
+
+def list_archive(archive_path: str, args) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        entries = select_entries(arc_file, args.glob)
+        return {
+            'parse_time': arc_file.parse_time,
+            'file_count': len(entries),
+            'files': [{'name': entry.file_name, 'size': entry.file_size,
+                       'addr': entry.file_addr, 'category': entry.category} for entry in entries],
+        }
+
+def extract_archive(archive_path: str, args) -> Dict:
+    output_dir = os.path.join(args.output, archive_stem(archive_path))
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        entries = select_entries(arc_file, args.glob)
+        extractor = ArcExtractor(arc_file)
+        if args.sequential:
+            result = extractor.extract_streaming(entries, output_dir)
+        else:
+            result = extractor.extract_files_parallel(entries, output_dir, args.workers, incremental=args.incremental)
+        return {
+            'ok': result.success_count == result.total_count,
+            'output_dir': output_dir,
+            'extracted': result.success_count - result.skipped_count,
+            'unchanged': result.skipped_count,
+            'total': result.total_count,
+            'bytes': result.bytes_written,
+            'mb_per_second': result.mb_per_second,
+            'files_per_second': result.files_per_second,
+            'failed': [{'name': r.file_name, 'error': r.error} for r in result.file_results if not r.success],
+        }
+
+def dedup_archive(archive_path: str, args) -> Dict:
+    layout_dir = os.path.join(args.layout, archive_stem(archive_path)) if args.layout else None
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        extractor = DedupExtractor(ContentStore(args.store))
+        result = extractor.extract(arc_file, archive_stem(archive_path), layout_dir, not args.copy, args.workers)
+        return {
+            'ok': not result.failed,
+            'entries': result.entries,
+            'unique': result.unique,
+            'new_objects': result.new_objects,
+            'bytes': result.bytes_total,
+            'bytes_stored': result.bytes_stored,
+            'failed': result.failed,
+        }
+
+def replace_in_archive(archive_path: str, args) -> Dict:
+    patch_set = {}
+    for assignment in args.set:
+        file_name, _, new_file_path = assignment.partition('=')
+        patch_set[file_name] = new_file_path
+
+    arc_file = ArcFile.parse(archive_path, use_mmap=True)
+    extractor = ArcExtractor(arc_file)
+    try:
+        missing = [name for name in patch_set if arc_file.find_entry(name) is None]
+        failed = []
+        if args.in_place:
+            # Apply every patch, even after one fails, and report the ones that did not go in
+            for name, path in patch_set.items():
+                if name not in missing and not extractor.patch_file_in_place(arc_file.find_entry(name), path):
+                    failed.append(name)
+            output_path = archive_path
+            ok = not failed
+        else:
+            # Regenerating over the source releases and reopens it (see regenerate_arc_file)
+            output_path = args.output or archive_path
+            ok = extractor.apply_patch_set(patch_set, output_path)
+            if not ok:
+                failed = [name for name in patch_set if name not in missing]
+        return {'ok': ok and not missing, 'output': output_path,
+                'replaced': len(patch_set) - len(missing) - len(failed), 'missing': missing, 'failed': failed}
+    finally:
+        extractor.arc_file.close()
+
+def repack_archive(archive_path: str, args) -> Dict:
+    input_dir = os.path.join(args.input, archive_stem(archive_path))
+    output_path = os.path.join(args.output, os.path.basename(archive_path))
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        extractor = ArcExtractor(arc_file)
+        patch_set = {}
+        if os.path.isdir(input_dir):
+            if args.changed_only:
+                patch_set = extractor.build_changed_patch_set(input_dir)
+            else:
+                patch_set = extractor.build_patch_set(input_dir)
+        compression = parse_compression(args.compress)
+        ok = extractor.apply_patch_set(patch_set, output_path, compression, args.workers)
+        return {'ok': ok, 'output': output_path, 'replaced': len(patch_set),
+                'compressed': sum(1 for entry in arc_file.file_entries if entry.original_size)}
+
+def compact_archive(archive_path: str, args) -> Dict:
+    extractor = ArcExtractor(ArcFile.parse(archive_path, use_mmap=True))
+    try:
+        dead_space = extractor.arc_file.dead_space()
+        ok = extractor.compact_arc_file()
+        return {'ok': ok, 'reclaimed': dead_space if ok else 0}
+    finally:
+        extractor.arc_file.close()
+
+def verify_archive(archive_path: str, args) -> Dict:
+    with ArcFile.parse(archive_path, use_mmap=True) as arc_file:
+        result = ArcVerifier(arc_file).verify(args.workers, checksums=not args.no_checksums)
+        return result.to_dict(include_entries=args.checksums_out)
+
+COMMANDS: Dict[str, Callable[[str, argparse.Namespace], Dict]] = {
+    'list': list_archive,
+    'extract': extract_archive,
+    'dedup': dedup_archive,
+    'replace': replace_in_archive,
+    'repack': repack_archive,
+    'compact': compact_archive,
+    'verify': verify_archive,
+}
+
+def run_one(command: Callable[[str, argparse.Namespace], Dict], archive_path: str, args) -> Dict:
+    """Run a command on one archive, turning failures into a summary entry"""
+    start_time = time.perf_counter()
+    try:
+        summary = command(archive_path, args)
+        summary.setdefault('ok', True)
+    except Exception as e:
+        summary = {'ok': False, 'error': str(e)}
+    summary['archive'] = archive_path
+    summary['elapsed'] = time.perf_counter() - start_time
+    return summary
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='dlarc', description='Headless tools for .arc archives')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of archives processed concurrently')
+    parser.add_argument('--indent', type=int, default=None, help='indent the JSON summary')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='log progress to stderr (-vv also logs every DIR entry)')
+    parser.add_argument('--counters', action='store_true',
+                        help='add phase timers and counters to the JSON summary')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='list the files in archives')
+    list_parser.add_argument('archives', nargs='+')
+    list_parser.add_argument('-g', '--glob', action='append', help='only list names matching this pattern')
+
+    extract_parser = subparsers.add_parser('extract', help='extract archives into OUTPUT/<archive name>/')
+    extract_parser.add_argument('archives', nargs='+')
+    extract_parser.add_argument('-o', '--output', required=True)
+    extract_parser.add_argument('-g', '--glob', action='append', help='only extract names matching this pattern')
+    extract_parser.add_argument('-w', '--workers', type=int, default=None, help='writer threads per archive')
+    extract_parser.add_argument('--incremental', action='store_true',
+                                help='skip files that are unchanged since the last incremental extraction')
+    extract_parser.add_argument('--sequential', action='store_true',
+                                help='read the archive front to back in one pass instead of using writer threads')
+
+    dedup_parser = subparsers.add_parser('dedup', help='extract archives into a content-addressed store, '
+                                                       'storing payloads shared between archives once')
+    dedup_parser.add_argument('archives', nargs='+')
+    dedup_parser.add_argument('-s', '--store', required=True, help='store directory (objects/ and index/)')
+    dedup_parser.add_argument('-l', '--layout', help='also recreate LAYOUT/<archive name>/ as hard links into the store')
+    dedup_parser.add_argument('--copy', action='store_true', help='copy files into the layout instead of linking')
+    dedup_parser.add_argument('-w', '--workers', type=int, default=None, help='writer threads per archive')
+
+    replace_parser = subparsers.add_parser('replace', help='replace entries of archives')
+    replace_parser.add_argument('archives', nargs='+')
+    replace_parser.add_argument('-s', '--set', action='append', required=True, metavar='NAME=FILE',
+                                help='replace entry NAME with the contents of FILE')
+    replace_parser.add_argument('-o', '--output', help='write the patched archive here instead of over the original')
+    replace_parser.add_argument('--in-place', action='store_true',
+                                help='patch the archive on disk without rewriting it (see compact)')
+
+    repack_parser = subparsers.add_parser('repack', help='rebuild archives with the files found in INPUT/<archive name>/')
+    repack_parser.add_argument('archives', nargs='+')
+    repack_parser.add_argument('-i', '--input', required=True)
+    repack_parser.add_argument('-o', '--output', required=True)
+    repack_parser.add_argument('--changed-only', action='store_true',
+                               help='only take files that changed since an incremental extraction')
+    repack_parser.add_argument('-z', '--compress', action='append', metavar='[CATEGORY=]METHOD',
+                               help='compress payloads of this category (all categories without one) '
+                                    'with zlib or lz4; the game engine cannot read such archives')
+    repack_parser.add_argument('-w', '--workers', type=int, default=None, help='compression processes per archive')
+
+    compact_parser = subparsers.add_parser('compact', help='reclaim space left by in-place patches')
+    compact_parser.add_argument('archives', nargs='+')
+
+    verify_parser = subparsers.add_parser('verify',
+                                          help='check DIR/DAT pairs, bounds and overlaps; warn about duplicate names')
+    verify_parser.add_argument('archives', nargs='+')
+    verify_parser.add_argument('-w', '--workers', type=int, default=None, help='checksum threads per archive')
+    verify_parser.add_argument('--no-checksums', action='store_true', help='only check the structure')
+    verify_parser.add_argument('--checksums-out', action='store_true',
+                               help='include every entry and its checksum in the summary')
+
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'replace' and args.output and len(args.archives) > 1:
+        print("Error: --output can only be used with a single archive", file=sys.stderr)
+        return 2
+
+    command = COMMANDS[args.command]
+    start_time = time.perf_counter()
+
+    # Log records go to stderr so stdout carries only the JSON summary
+    configure_logging([logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)], sys.stderr)
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        summaries = list(pool.map(lambda path: run_one(command, path, args), args.archives))
+
+    ok = all(summary['ok'] for summary in summaries)
+    report = {
+        'command': args.command,
+        'ok': ok,
+        'elapsed': time.perf_counter() - start_time,
+        'archives': summaries,
+    }
+    if args.counters:
+        report['instrumentation'] = instrumentation.export()
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=args.indent)
+    sys.stdout.write('\n')
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,68 @@
+import hashlib
+import json
 import os
 import shutil
-from typing import List, Tuple, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional, Union
+from arc_logging import instrumentation, logger
 from arc_parser import ArcFile, FileEntry, DataBlock
+from arc_progress import CancellationToken, OperationCancelled, ProgressCallback, ProgressTracker
+
+# Written beside the extracted tree to let later runs skip unchanged entries
+MANIFEST_NAME = '.dlarc_manifest.json'
+
+def content_hash(data: Union[bytes, memoryview]) -> str:
+    """Fast content hash used by the extraction manifest"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class FileResult:
+    """Outcome of extracting a single file entry"""
+    def __init__(self, file_name: str, output_path: str, size: int, success: bool, error: Optional[str] = None,
+                 skipped: bool = False, record: Optional[Dict] = None):
+        self.file_name = file_name
+        self.output_path = output_path
+        self.size = size
+        self.success = success
+        self.error = error
+        self.skipped = skipped
+        self.record = record
+
+class ExtractionResult:
+    """Per-file results and aggregate throughput of an extraction run"""
+    def __init__(self, file_results: List[FileResult], elapsed: float, cancelled: bool = False):
+        self.file_results = file_results
+        self.elapsed = elapsed
+        self.cancelled = cancelled
+
+    def __str__(self):
+        return (f"ExtractionResult({self.success_count}/{self.total_count} files, {self.skipped_count} unchanged, "
+                f"{self.bytes_written / (1024 * 1024):.1f} MB in {self.elapsed:.2f}s, "
+                f"{self.mb_per_second:.1f} MB/s, {self.files_per_second:.0f} files/s)")
+
+    @property
+    def success_count(self) -> int:
+        return sum(1 for result in self.file_results if result.success)
+
+    @property
+    def total_count(self) -> int:
+        return len(self.file_results)
+
+    @property
+    def skipped_count(self) -> int:
+        return sum(1 for result in self.file_results if result.skipped)
+
+    @property
+    def bytes_written(self) -> int:
+        return sum(result.size for result in self.file_results if result.success and not result.skipped)
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_written / (1024 * 1024) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.success_count / self.elapsed if self.elapsed > 0 else 0.0
 
 class ArcExtractor:
     """Handles extraction of files from ARC archives"""
@@ -25,41 +86,223 @@ class ArcExtractor:
             
             return True
         except Exception as e:
-            print(f"Error extracting {file_entry.file_name}: {e}")
+            logger.error("Error extracting %s: %s", file_entry.file_name, e)
             return False
     
-    def extract_all_files(self, output_dir: str) -> Tuple[int, int]:
+    def extract_all_files(self, output_dir: str, max_workers: int = 1) -> Tuple[int, int]:
         """Extract all files from the ARC archive"""
+        return self.extract_selected_files(self.arc_file.file_entries, output_dir, max_workers)
+    
+    def extract_selected_files(self, selected_files: List[FileEntry], output_dir: str,
+                               max_workers: int = 1) -> Tuple[int, int]:
+        """Extract selected files from the ARC archive"""
+        if max_workers != 1:
+            result = self.extract_files_parallel(selected_files, output_dir, max_workers)
+            return result.success_count, result.total_count
+        
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
         success_count = 0
-        total_count = len(self.arc_file.file_entries)
+        total_count = len(selected_files)
         
-        for file_entry in self.arc_file.file_entries:
+        for file_entry in selected_files:
             output_path = os.path.join(output_dir, file_entry.file_name)
             
             if self.extract_file(file_entry, output_path):
                 success_count += 1
         
         return success_count, total_count
-    
-    def extract_selected_files(self, selected_files: List[FileEntry], output_dir: str) -> Tuple[int, int]:
-        """Extract selected files from the ARC archive"""
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+
+    def extract_files_parallel(self, selected_files: List[FileEntry], output_dir: str,
+                               max_workers: Optional[int] = None,
+                               progress_callback: Optional[ProgressCallback] = None,
+                               cancel_token: Optional[CancellationToken] = None,
+                               incremental: bool = False) -> ExtractionResult:
+        """Extract files concurrently with a pool of writer threads
+
+        The output directory tree is created once up front, then each entry is
+        written by a worker; max_workers=None lets the pool pick its default size.
+        progress_callback is called from the worker threads. Once cancel_token is
+        cancelled, the remaining entries are skipped and reported as failed.
+        With incremental, entries whose content and output file match the manifest
+        of the previous run are left alone, and the manifest is updated afterwards.
+        """
+        start_time = time.perf_counter()
         
-        success_count = 0
-        total_count = len(selected_files)
+        output_paths = [os.path.join(output_dir, entry.file_name) for entry in selected_files]
+        for directory in {os.path.dirname(path) for path in output_paths}:
+            os.makedirs(directory or output_dir, exist_ok=True)
+        
+        tracker = ProgressTracker(len(selected_files), sum(entry.file_size for entry in selected_files),
+                                  progress_callback)
         
+        manifest = self.load_manifest(output_dir) if incremental else None
+        
+        def write_file(file_entry: FileEntry, output_path: str) -> FileResult:
+            if cancel_token is not None and cancel_token.cancelled:
+                return FileResult(file_entry.file_name, output_path, 0, False, "Cancelled")
+            if manifest is not None:
+                result = self._write_file_incremental(file_entry, output_path, manifest.get(file_entry.file_name))
+            else:
+                result = self._write_file(file_entry, output_path)
+            tracker.advance(1, file_entry.file_size)
+            return result
+        
+        # Entries with the same name share an output path; each group is written in
+        # order by one worker, so the last entry wins as in a sequential extraction
+        groups: Dict[str, List[int]] = {}
+        for i, path in enumerate(output_paths):
+            groups.setdefault(os.path.normcase(os.path.normpath(path)), []).append(i)
+        
+        def write_group(indices: List[int]) -> List[Tuple[int, FileResult]]:
+            return [(i, write_file(selected_files[i], output_paths[i])) for i in indices]
+        
+        file_results: List[Optional[FileResult]] = [None] * len(selected_files)
+        with instrumentation.phase('extraction'), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for group_results in pool.map(write_group, groups.values()):
+                for i, result in group_results:
+                    file_results[i] = result
+        tracker.finish()
+        
+        extracted = [result for result in file_results if result.success and not result.skipped]
+        instrumentation.count('files_extracted', len(extracted))
+        instrumentation.count('bytes_extracted', sum(result.size for result in extracted))
+        
+        if manifest is not None:
+            for result in file_results:
+                if result.record is not None:
+                    manifest[result.file_name] = result.record
+            self.save_manifest(output_dir, manifest)
+        
+        cancelled = cancel_token is not None and cancel_token.cancelled
+        return ExtractionResult(file_results, time.perf_counter() - start_time, cancelled)
+
+    def extract_streaming(self, selected_files: List[FileEntry], output_dir: str,
+                          progress_callback: Optional[ProgressCallback] = None,
+                          cancel_token: Optional[CancellationToken] = None) -> ExtractionResult:
+        """Extract files in one sequential pass over the archive using ArcFile.iter_entries
+
+        Entries are written in file-offset order, chunk by chunk, which suits
+        archives on spinning disks or network shares better than random access.
+        """
+        start_time = time.perf_counter()
+        
+        for directory in {os.path.dirname(os.path.join(output_dir, entry.file_name)) for entry in selected_files}:
+            os.makedirs(directory or output_dir, exist_ok=True)
+        
+        tracker = ProgressTracker(len(selected_files), sum(entry.file_size for entry in selected_files),
+                                  progress_callback)
+        results: Dict[int, FileResult] = {}
+        
+        # Entries go through iter_entries one at a time, still front to back, so a
+        # failing entry is reported on its own and the pass goes on with the next
+        indexed = [(self.arc_file.index_of(entry), entry) for entry in selected_files]
+        order = sorted((pair for pair in indexed if pair[0] is not None),
+                       key=lambda pair: self.arc_file.stored_span(pair[0])[0])
+        
+        with instrumentation.phase('extraction'), self.arc_file.sequential_access():
+            for _, file_entry in order:
+                if cancel_token is not None and cancel_token.cancelled:
+                    break
+                if id(file_entry) in results:
+                    continue
+                output_path = os.path.join(output_dir, file_entry.file_name)
+                written, error, found = 0, None, False
+                try:
+                    with open(output_path, 'wb') as output:
+                        for _, chunk in self.arc_file.iter_entries([file_entry]):
+                            found = True
+                            output.write(chunk)
+                            written += len(chunk)
+                    if not found:
+                        error = "Data out of bounds"
+                except Exception as e:
+                    error = str(e)
+                results[id(file_entry)] = FileResult(file_entry.file_name, output_path, written, error is None, error)
+                tracker.advance(1, written)
+        tracker.finish()
+        
+        file_results = []
         for file_entry in selected_files:
             output_path = os.path.join(output_dir, file_entry.file_name)
-            
-            if self.extract_file(file_entry, output_path):
-                success_count += 1
+            error = "Cancelled" if cancel_token is not None and cancel_token.cancelled else "Data out of bounds"
+            file_results.append(results.get(id(file_entry)) or
+                                FileResult(file_entry.file_name, output_path, 0, False, error))
         
-        return success_count, total_count
+        extracted = [result for result in file_results if result.success]
+        instrumentation.count('files_extracted', len(extracted))
+        instrumentation.count('bytes_extracted', sum(result.size for result in extracted))
+        
+        cancelled = cancel_token is not None and cancel_token.cancelled
+        return ExtractionResult(file_results, time.perf_counter() - start_time, cancelled)
+
+    def _write_file(self, file_entry: FileEntry, output_path: str) -> FileResult:
+        """Write one entry to an already existing directory"""
+        try:
+            file_data = self.arc_file.get_file_data(file_entry)
+            if file_data is None:
+                return FileResult(file_entry.file_name, output_path, 0, False, "Data out of bounds")
+            
+            with open(output_path, 'wb') as f:
+                f.write(file_data)
+            
+            return FileResult(file_entry.file_name, output_path, len(file_data), True)
+        except Exception as e:
+            return FileResult(file_entry.file_name, output_path, 0, False, str(e))
     
+    def _write_file_incremental(self, file_entry: FileEntry, output_path: str,
+                                record: Optional[Dict]) -> FileResult:
+        """Write one entry unless the manifest shows the output already holds it"""
+        try:
+            file_data = self.arc_file.get_file_data(file_entry)
+            if file_data is None:
+                return FileResult(file_entry.file_name, output_path, 0, False, "Data out of bounds")
+            
+            digest = content_hash(file_data)
+            if record is not None and record['size'] == len(file_data) and record['hash'] == digest:
+                try:
+                    stat = os.stat(output_path)
+                    if stat.st_size == record['size'] and stat.st_mtime_ns == record['mtime_ns']:
+                        return FileResult(file_entry.file_name, output_path, len(file_data), True,
+                                          skipped=True, record=record)
+                except FileNotFoundError:
+                    pass
+            
+            with open(output_path, 'wb') as f:
+                f.write(file_data)
+            
+            record = {
+                'size': len(file_data),
+                'hash': digest,
+                'timestamp1': file_entry.timestamp1,
+                'timestamp2': file_entry.timestamp2,
+                'mtime_ns': os.stat(output_path).st_mtime_ns,
+            }
+            return FileResult(file_entry.file_name, output_path, len(file_data), True, record=record)
+        except Exception as e:
+            return FileResult(file_entry.file_name, output_path, 0, False, str(e))
+
+    def load_manifest(self, output_dir: str) -> Dict[str, Dict]:
+        """Per-entry records of a previous incremental extraction into output_dir"""
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except FileNotFoundError:
+            return {}
+        except (ValueError, AttributeError) as e:
+            logger.warning("Ignoring unreadable manifest %s: %s", manifest_path, e)
+            return {}
+
+    def save_manifest(self, output_dir: str, records: Dict[str, Dict]):
+        """Write the extraction manifest beside the output tree"""
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'archive': self.arc_file.file_path, 'hash': 'blake2b-128', 'files': records},
+                      f, ensure_ascii=False)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
     def get_file_info(self) -> List[Tuple[str, str, str]]:
         """Get detailed information about all files"""
         file_info = []
@@ -81,23 +324,54 @@ class ArcExtractor:
         
         return file_info
     
-    def regenerate_arc_file(self, output_path: str) -> bool:
-        """Regenerate the ARC file and save it to the specified path"""
+    def regenerate_arc_file(self, output_path: str, progress_callback: Optional[ProgressCallback] = None,
+                            cancel_token: Optional[CancellationToken] = None) -> bool:
+        """Regenerate the ARC file and stream it to the specified path"""
+        temp_path = output_path + '.tmp'
         try:
-            new_data = self.arc_file.regenerate()
-            
             output_dir = os.path.dirname(output_path)
             if output_dir and not os.path.exists(output_dir):
                 os.makedirs(output_dir)
             
-            with open(output_path, 'wb') as f:
-                f.write(new_data)
+            # Write next to the target and swap it in, so regenerating over the
+            # archive that is currently mapped never truncates it mid-copy.
+            with instrumentation.phase('regeneration'), open(temp_path, 'wb') as f:
+                self.arc_file.write_to(f, progress_callback, cancel_token)
+            source_path = self.arc_file.file_path
+            if source_path is not None and os.path.exists(output_path) and os.path.samefile(source_path, output_path):
+                # Windows refuses to replace a file that is open and mapped; release
+                # it first and reopen the regenerated archive, like ArcFile.compact
+                use_mmap = self.arc_file.is_mapped
+                self.arc_file.close()
+                try:
+                    os.replace(temp_path, output_path)
+                    self.arc_file = ArcFile.parse(output_path, use_mmap=use_mmap)
+                except Exception:
+                    self._reopen(source_path, use_mmap)
+                    raise
+            else:
+                os.replace(temp_path, output_path)
             
             return True
+        except OperationCancelled:
+            logger.info("Regeneration cancelled")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
         except Exception as e:
-            print(f"Error regenerating ARC file: {e}")
+            logger.error("Error regenerating ARC file: %s", e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             return False
 
+    def _reopen(self, file_path: str, use_mmap: bool):
+        """Open the archive on disk again after a failed swap left self.arc_file closed"""
+        try:
+            self.arc_file = ArcFile.parse(file_path, use_mmap=use_mmap)
+            logger.warning("Reopened %s as it is on disk; pending replacements have to be applied again", file_path)
+        except Exception as e:
+            logger.error("Error reopening %s: %s", file_path, e)
+
     def replace_file(self, file_entry: FileEntry, new_file_path: str) -> bool:
         """Replace a file in the ARC file with a new file"""
         try:
@@ -107,13 +381,94 @@ class ArcExtractor:
             success = self.arc_file.replace_file_data(file_entry, new_file_data)
             
             if success:
-                print(f"Successfully replaced file: {file_entry.file_name}")
-                print(f"New size: {file_entry.file_size} bytes")
+                logger.info("Successfully replaced file: %s (new size: %d bytes)",
+                            file_entry.file_name, file_entry.file_size)
                 return True
             else:
-                print(f"Failed to replace file: {file_entry.file_name}")
+                logger.error("Failed to replace file: %s", file_entry.file_name)
                 return False
                 
         except Exception as e:
-            print(f"Error replacing file {file_entry.file_name}: {e}")
+            logger.error("Error replacing file %s: %s", file_entry.file_name, e)
+            return False
+
+    def build_patch_set(self, input_dir: str) -> Dict[str, str]:
+        """Map every entry that has a file at its extracted path under input_dir to that file"""
+        patch_set = {}
+        for entry in self.arc_file.file_entries:
+            path = os.path.join(input_dir, entry.file_name)
+            if os.path.isfile(path):
+                patch_set[entry.file_name] = path
+        return patch_set
+
+    def build_changed_patch_set(self, input_dir: str) -> Dict[str, str]:
+        """Like build_patch_set, but only files that differ from what was extracted
+
+        Files whose size and mtime still match the manifest of an incremental
+        extraction into input_dir are not read at all; the rest are hashed and kept
+        only if their content changed. Without a manifest every file is included.
+        """
+        manifest = self.load_manifest(input_dir)
+        patch_set = {}
+        for file_name, path in self.build_patch_set(input_dir).items():
+            record = manifest.get(file_name)
+            if record is not None:
+                stat = os.stat(path)
+                if stat.st_size == record['size'] and stat.st_mtime_ns == record['mtime_ns']:
+                    continue
+                if stat.st_size == record['size']:
+                    with open(path, 'rb') as f:
+                        if content_hash(f.read()) == record['hash']:
+                            continue
+            patch_set[file_name] = path
+        return patch_set
+
+    def apply_patch_set(self, patch_set: Dict[str, Union[bytes, str]], output_path: str,
+                        compression: Optional[Dict[Optional[int], str]] = None,
+                        max_workers: Optional[int] = None) -> bool:
+        """Replace every entry in patch_set and stream the patched archive to output_path
+
+        With compression (category -> method, see ArcFile.compress_entries) eligible
+        payloads are compressed by max_workers processes before writing.
+        """
+        missing = self.arc_file.replace_files(patch_set)
+        for file_name in missing:
+            logger.warning("%s is not in the archive, skipped", file_name)
+        
+        logger.info("Replaced %d files", len(patch_set) - len(missing))
+        if compression:
+            try:
+                saved = self.arc_file.compress_entries(compression, max_workers)
+            except Exception as e:
+                logger.error("Error compressing ARC file: %s", e)
+                return False
+            logger.info("Compression saved %d bytes", saved)
+        return self.regenerate_arc_file(output_path)
+
+    def patch_file_in_place(self, file_entry: FileEntry, new_file_path: str) -> bool:
+        """Patch a file directly in the ARC file on disk (see ArcFile.patch_in_place)"""
+        try:
+            with open(new_file_path, 'rb') as f:
+                new_file_data = f.read()
+            
+            if self.arc_file.patch_in_place(file_entry, new_file_data):
+                logger.info("Successfully patched file in place: %s", file_entry.file_name)
+                return True
+            else:
+                logger.error("Failed to patch file: %s", file_entry.file_name)
+                return False
+                
+        except Exception as e:
+            logger.error("Error patching file %s: %s", file_entry.file_name, e)
+            return False
+
+    def compact_arc_file(self) -> bool:
+        """Reclaim the dead space left in the ARC file by in-place patches"""
+        try:
+            dead_space = self.arc_file.dead_space()
+            self.arc_file = self.arc_file.compact()
+            logger.info("Reclaimed %d bytes", dead_space)
+            return True
+        except Exception as e:
+            logger.error("Error compacting ARC file: %s", e)
             return False
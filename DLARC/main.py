@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
-import tkinter as tk
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from arc_gui import ArcUnpackerGUI
-
 def main():
+    # Any arguments select the headless command-line interface
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
     try:
+        import tkinter as tk
+        from arc_gui import ArcUnpackerGUI
+        from arc_logging import configure_logging
+        
+        # Warnings from the archive code (invalid blocks, failed writes) go to the console
+        configure_logging()
         root = tk.Tk()
         ArcUnpackerGUI(root)
         root.mainloop()
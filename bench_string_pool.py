@@ -0,0 +1,62 @@
+import argparse
+import time
+import msgpack
+from parser import StringPool
+
+def load_string_references(path='events.msgpack'):
+    """Strings in the order the extractor interns them, repeats included"""
+    with open(path, 'rb') as f:
+        data = msgpack.unpackb(f.read())
+    text_pool = data['text_pool']
+    references = []
+    for event in data['events']:
+        for instruction in event['instructions']:
+            for param in instruction['string_params']:
+                if param.startswith('$'):
+                    references.append(text_pool[int(param[1:])])
+    return references
+
+def intern_with_list(references):
+    """What _get_string_data used to do: membership test and index() on a list"""
+    pool = []
+    for string in references:
+        if string not in pool:
+            pool.append(string)
+        pool.index(string)
+    return pool
+
+def intern_with_pool(references):
+    pool = StringPool()
+    for string in references:
+        pool.intern(string)
+    return pool.strings
+
+def scaled(references, factor):
+    """The script repeated factor times with distinct strings per copy, like a longer game"""
+    return [f'{string}#{copy}' if copy else string for copy in range(factor) for string in references]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Compare StringPool with the list it replaced')
+    arg_parser.add_argument('-s', '--scales', type=int, nargs='+', default=[1, 2, 4, 8])
+    # The list baseline is quadratic: about 8s at scale 1, 40s at 2 and minutes beyond
+    arg_parser.add_argument('-l', '--list-max-scale', type=int, default=1,
+                            help='only run the list baseline up to this scale')
+    args = arg_parser.parse_args()
+
+    references = load_string_references()
+    print(f'{len(references)} string references, {len(set(references))} distinct')
+    print(f'{"scale":>5} {"distinct":>9} {"list (s)":>10} {"StringPool (s)":>15}')
+    for factor in args.scales:
+        workload = scaled(references, factor)
+        expected = None
+        if factor <= args.list_max_scale:
+            start_time = time.perf_counter()
+            expected = intern_with_list(workload)
+            list_time = f'{time.perf_counter() - start_time:>10.3f}'
+        else:
+            list_time = f'{"-":>10}'
+        start_time = time.perf_counter()
+        result = intern_with_pool(workload)
+        pool_time = time.perf_counter() - start_time
+        assert expected is None or result == expected, 'StringPool changed the pool order'
+        print(f'{factor:>5} {len(result):>9} {list_time} {pool_time:>15.4f}')
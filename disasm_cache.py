@@ -0,0 +1,210 @@
+from collections import namedtuple
+from typing import List, Optional
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import msgpack
+
+# Bump when the decoded format changes; older cache entries are then discarded
+CACHE_VERSION = 1
+
+# What the parser needs from an operand; type and access are enum member names
+DecodedOperand = namedtuple('DecodedOperand', ['type', 'value', 'register', 'access', 'name'])
+DecodedInstruction = namedtuple('DecodedInstruction', ['ea', 'is_call', 'is_indirect_jump_or_call', 'operands'])
+
+def _decode_operand(operand, with_name: bool) -> Optional[DecodedOperand]:
+    if operand is None:
+        return None
+    op_type = operand.type.name
+    try:
+        value = operand.get_value()
+    except Exception:
+        value = None
+    if not isinstance(value, int):
+        value = None
+    register = operand.get_register_name() if op_type == 'REGISTER' else None
+    try:
+        access = operand.get_access_type().name
+    except Exception:
+        access = None
+    name = operand.get_name() if with_name and hasattr(operand, 'get_name') else None
+    return DecodedOperand(op_type, value, register, access, name)
+
+def decode_instruction(db, inst) -> DecodedInstruction:
+    """Read everything the parser looks at for one instruction in a single pass"""
+    is_call = db.instructions.is_call_instruction(inst)
+    operands = db.instructions.get_operands(inst)
+    return DecodedInstruction(inst.ea, is_call, db.instructions.is_indirect_jump_or_call(inst),
+                              tuple(_decode_operand(op, is_call and i == 0) for i, op in enumerate(operands)))
+
+def hash_database(db_path: str) -> str:
+    """Content hash of an .i64, used to key the cache"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(db_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class LazyDatabase:
+    """Opens the IDA database on first use only, optionally from a private copy"""
+    def __init__(self, db_path: str, private_copy: bool = False):
+        self.db_path = db_path
+        self.private_copy = private_copy
+        self._db = None
+        self._work_dir = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            from ida_domain import Database
+            path = self.db_path
+            if self.private_copy:
+                # IDA unpacks a database next to the .i64, so processes cannot share one file
+                self._work_dir = tempfile.mkdtemp(prefix='alive-extract-')
+                path = os.path.join(self._work_dir, os.path.basename(self.db_path))
+                shutil.copyfile(self.db_path, path)
+            self._db = Database.open(path=path, save_on_close=False)
+        return self._db
+
+    @property
+    def is_open(self) -> bool:
+        return self._db is not None
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class IdaSource:
+    """Functions, strings and pseudocode read straight from an IDA database"""
+    def __init__(self, db):
+        # An ida_domain Database or a LazyDatabase
+        self._db = db
+
+    @property
+    def db(self):
+        return self._db.db if isinstance(self._db, LazyDatabase) else self._db
+
+    def function_name(self, ea: int) -> Optional[str]:
+        func = self.db.functions.get_at(ea)
+        return func.name if func else None
+
+    def function_start(self, name: str) -> Optional[int]:
+        func = self.db.functions.get_function_by_name(name)
+        return func.start_ea if func else None
+
+    def instructions(self, start_ea: int) -> List[DecodedInstruction]:
+        db = self.db
+        func = db.functions.get_at(start_ea)
+        return [decode_instruction(db, inst) for inst in db.functions.get_instructions(func)]
+
+    def pseudocode(self, ea: int) -> List[str]:
+        return list(self.db.functions.get_pseudocode(self.db.functions.get_at(ea)))
+
+    def function_hash(self, start_ea: int) -> str:
+        """Content hash of a function's bytes, to tell which events changed between builds"""
+        func = self.db.functions.get_at(start_ea)
+        data = self.db.bytes.get_bytes_at(func.start_ea, func.end_ea - func.start_ea)
+        return hashlib.blake2b(bytes(data), digest_size=16).hexdigest()
+
+    def c_string(self, addr: int, max_size: int) -> bytes:
+        """NUL-terminated bytes at addr, fetched in one ranged read where possible"""
+        db = self.db
+        try:
+            data = db.bytes.get_bytes_at(addr, max_size)
+        except Exception:
+            data = None
+        if data is not None:
+            end = data.find(b'\0')
+            return bytes(data[:end]) if end != -1 else bytes(data)
+        # Ranged read unavailable here; fall back to byte by byte
+        data = []
+        ptr = addr
+        for i in range(max_size):
+            byte_val = db.bytes.get_byte_at(ptr)
+            if byte_val == 0: break
+            data.append(byte_val)
+            ptr += 1
+        return bytes(data)
+
+class DisasmCache:
+    """SQLite store of decoded functions, strings and pseudocode per database hash"""
+    def __init__(self, cache_path: str, db_hash: str):
+        self.db_hash = db_hash
+        self._conn = sqlite3.connect(cache_path, timeout=60)
+        # Several extraction processes may read and fill the cache at once
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                db_hash TEXT, kind TEXT, key TEXT, value BLOB,
+                PRIMARY KEY (db_hash, kind, key));
+        ''')
+        version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None or int(version[0]) != CACHE_VERSION:
+            with self._conn:
+                self._conn.execute('DELETE FROM entries')
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CACHE_VERSION),))
+
+    def get(self, kind: str, key):
+        row = self._conn.execute('SELECT value FROM entries WHERE db_hash = ? AND kind = ? AND key = ?',
+                                 (self.db_hash, kind, str(key))).fetchone()
+        return msgpack.unpackb(row[0]) if row is not None else None
+
+    def put(self, kind: str, key, value):
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                               (self.db_hash, kind, str(key), msgpack.packb(value)))
+
+    def close(self):
+        self._conn.close()
+
+class CachedSource(IdaSource):
+    """IdaSource that answers from a DisasmCache and only opens the database on a miss
+
+    Lookups are stored wrapped in a one-element list so that a cached None (a
+    missing function) can be told apart from a miss.
+    """
+    def __init__(self, db: LazyDatabase, cache: DisasmCache):
+        super().__init__(db)
+        self.cache = cache
+
+    def _cached(self, kind: str, key, compute):
+        hit = self.cache.get(kind, key)
+        if hit is not None:
+            return hit[0]
+        value = compute()
+        self.cache.put(kind, key, [value])
+        return value
+
+    def function_name(self, ea: int) -> Optional[str]:
+        return self._cached('function_name', ea, lambda: super(CachedSource, self).function_name(ea))
+
+    def function_start(self, name: str) -> Optional[int]:
+        return self._cached('function_start', name, lambda: super(CachedSource, self).function_start(name))
+
+    def instructions(self, start_ea: int) -> List[DecodedInstruction]:
+        rows = self._cached('instructions', start_ea, lambda: super(CachedSource, self).instructions(start_ea))
+        return [DecodedInstruction(ea, is_call, is_indirect,
+                                   tuple(DecodedOperand(*op) if op is not None else None for op in operands))
+                for ea, is_call, is_indirect, operands in rows]
+
+    def pseudocode(self, ea: int) -> List[str]:
+        return self._cached('pseudocode', ea, lambda: super(CachedSource, self).pseudocode(ea))
+
+    def function_hash(self, start_ea: int) -> str:
+        return self._cached('function_hash', start_ea, lambda: super(CachedSource, self).function_hash(start_ea))
+
+    def c_string(self, addr: int, max_size: int) -> bytes:
+        return self._cached('c_string', addr, lambda: super(CachedSource, self).c_string(addr, max_size))
@@ -1,56 +1,198 @@
-from ida_domain import Database
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, util
+import argparse
 import json
+import os
 from constants import *
-from parser import get_event_mappings, string_pool
+from disasm_cache import CachedSource, DisasmCache, IdaSource, LazyDatabase, hash_database
+from parser import EventMapping, get_event_mappings, string_pool
 from event_mapping_pb2 import EventMappings, EventMapping as PBEventMapping, Instruction
 import msgpack
- 
-def extract(db_path):
-    with Database.open(path=db_path, save_on_close=False) as db:
-        mappings = db.functions.get_at(PLOT_MAPPINGS_ADDR)
-        print('name: ' + mappings.name)
-        mappings_instructions = list(db.functions.get_instructions(mappings))
-        print('total instructions: ' + str(len(mappings_instructions)))
+
+# Events handed to a worker at a time; small enough to keep all workers busy to the end
+SHARD_SIZE = 32
+
+# Function byte hashes of the last run, used by incremental runs to find changed events, and
+# where each event table entry (by pos; evIds repeat) ended up in its events, None if dropped
+HASHES_PATH = 'events.hashes.json'
+
+_worker_source = None
+
+def make_source(db, cache_path, db_hash):
+    """Source of decoded functions for the parser, backed by the disassembly cache if there is one"""
+    if cache_path is None:
+        return IdaSource(db)
+    return CachedSource(db, DisasmCache(cache_path, db_hash))
+
+def _open_worker_source(db_path, cache_path, db_hash):
+    """Process pool initializer: the worker opens a private copy of the database if the cache misses"""
+    global _worker_source
+    db = LazyDatabase(db_path, private_copy=True)
+    _worker_source = make_source(db, cache_path, db_hash)
+
+    def close():
+        db.close()
+        if cache_path is not None:
+            _worker_source.cache.close()
+    # Pool workers leave through os._exit, which skips atexit handlers
+    util.Finalize(None, close, exitpriority=10)
+
+def _extract_shard(shard):
+    """Extract one shard in a worker, returns the events and the strings they reference"""
+    string_pool.clear()
+    for mapping in shard:
+        mapping.get_instructions(_worker_source)
+    return shard, list(string_pool.strings)
+
+def extract_parallel(db_path, event_mappings, workers, cache_path=None, db_hash=None):
+    """Extract event instructions in worker processes
+
+    Events are split into consecutive shards and every shard's strings are merged
+    into string_pool in shard order, so the text pool and '$<id>' references come
+    out exactly as in a serial run.
+    """
+    shards = [event_mappings[i:i + SHARD_SIZE] for i in range(0, len(event_mappings), SHARD_SIZE)]
+    extracted = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                             initializer=_open_worker_source, initargs=(db_path, cache_path, db_hash)) as pool:
+        with tqdm(total=len(event_mappings), desc='Processing events') as progress:
+            for shard, strings in pool.map(_extract_shard, shards):
+                id_map = string_pool.merge(strings)
+                for mapping in shard:
+                    mapping.remap_strings(id_map)
+                extracted.extend(shard)
+                progress.update(len(shard))
+    return extracted
+
+def load_previous_run(events_path='events.msgpack'):
+    """Text pool, events, function hashes and event index by pos written by an earlier run, or None without one"""
+    if not os.path.exists(events_path) or not os.path.exists(HASHES_PATH):
+        return None
+    with open(HASHES_PATH, 'r', encoding='utf-8') as f:
+        hashes = json.load(f)
+    if 'functions' not in hashes:
+        # Written before events were tracked by pos
+        return None
+    with open(events_path, 'rb') as f:
+        previous = msgpack.unpackb(f.read())
+    return previous['text_pool'], previous['events'], hashes['functions'], hashes['events']
+
+def extract(db_path, workers=1, cache_path=None, incremental=False, only_events=(), only_functions=()):
+    """Extract events; with cache_path, decoded functions are kept there for later runs
+
+    With incremental, the previous outputs are loaded and only events whose
+    function bytes changed, or that are listed in only_events (evIds) or
+    only_functions (evFunc names), are extracted again and spliced back in. String
+    ids of the previous text pool stay valid; new strings are appended to it.
+    """
+    previous = load_previous_run() if incremental else None
+    if incremental and previous is None:
+        tqdm.write('No previous run to update, extracting everything')
+    if previous is not None:
+        string_pool.merge(previous[0])
+
+    db_hash = hash_database(db_path) if cache_path is not None else None
+    with LazyDatabase(db_path) as db:
+        source = make_source(db, cache_path, db_hash)
+        print('name: ' + source.function_name(PLOT_MAPPINGS_ADDR))
+        print('total instructions: ' + str(len(source.instructions(PLOT_MAPPINGS_ADDR))))
         print('fetching event metadata...')
-        event_mappings = get_event_mappings(db.functions.get_pseudocode(mappings))
+        event_mappings = get_event_mappings(source.pseudocode(PLOT_MAPPINGS_ADDR))
         print(f'✓ gathered {len(event_mappings)} event metadata')
 
-        events = []
-        for mapping in tqdm(event_mappings[:], desc='Processing events'):
-            mapping.get_instructions(db)
-            tqdm.write(f'Fetched Event {mapping.evId} instructions: {len(mapping.instructions)}')
-            if mapping.evId == 1 and len(mapping.instructions) == 0 and len(mapping.return_values) == 1 and mapping.return_values[0] == 950: continue
-            if len(mapping.return_values) == 0: continue
-            events.append(mapping)
+        hashes = {}
+        for mapping in event_mappings:
+            if mapping.evFunc not in hashes:
+                hashes[mapping.evFunc] = mapping.function_hash(source)
+
+        selected = event_mappings
+        if previous is not None:
+            old_hashes, old_events = previous[2], previous[3]
+            selected = [mapping for mapping in event_mappings
+                        if mapping.evId in only_events or mapping.evFunc in only_functions
+                        or str(mapping.pos) not in old_events
+                        or mapping.evFunc not in old_hashes or old_hashes[mapping.evFunc] != hashes[mapping.evFunc]]
+            print(f're-extracting {len(selected)} of {len(event_mappings)} events')
+
+        if workers <= 1:
+            for mapping in tqdm(selected[:], desc='Processing events'):
+                mapping.get_instructions(source)
+
+        opened = db.is_open
+        if cache_path is not None:
+            source.cache.close()
+
+    tqdm.write('✓ Database closed' if opened else '✓ Everything came from the disassembly cache')
+
+    if workers > 1:
+        selected = extract_parallel(db_path, selected, workers, cache_path, db_hash)
+
+    # Paired by pos: several table entries can share an evId (see the evId 1 filter below)
+    extracted = {mapping.pos: mapping for mapping in selected}
+    events = []
+    for mapping in event_mappings:
+        if mapping.pos not in extracted:
+            # Unchanged since the previous run; events it dropped stay dropped
+            index = previous[3][str(mapping.pos)]
+            if index is not None:
+                event = EventMapping.from_dict(previous[1][index])
+                event.pos = mapping.pos
+                events.append(event)
+            continue
+        mapping = extracted[mapping.pos]
+        tqdm.write(f'Fetched Event {mapping.evId} instructions: {len(mapping.instructions)}')
+        if mapping.evId == 1 and len(mapping.instructions) == 0 and len(mapping.return_values) == 1 and mapping.return_values[0] == 950: continue
+        if len(mapping.return_values) == 0: continue
+        events.append(mapping)
+
+    print("Got events", len(events))
+    events = sorted(events, key=lambda x: x.evId)
+    # to_dict() drops pos, so index the events first
+    event_index = {str(mapping.pos): None for mapping in event_mappings}
+    event_index.update((str(mapping.pos), i) for i, mapping in enumerate(events))
 
-        print("Got events", len(events))
-        events = sorted(events, key=lambda x: x.evId)
+    # Create protobuf EventMappings container
+    text_pool = string_pool.strings
+    event_mappings_pb = EventMappings()
+    event_mappings_pb.text_pool.extend(text_pool)
 
-        # Create protobuf EventMappings container
-        event_mappings_pb = EventMappings()
-        event_mappings_pb.text_pool.extend(string_pool)
+    with open('events.json', 'w', encoding='utf-8') as f:
+        json.dump({'text_pool': text_pool, 'events': [mapping.to_dict() for mapping in events]}, f, ensure_ascii=False)
 
-        with open('events.json', 'w', encoding='utf-8') as f:
-            json.dump({'text_pool': string_pool, 'events': [mapping.to_dict() for mapping in events]}, f, ensure_ascii=False)
+    with open('events.indent.json', 'w', encoding='utf-8') as f:
+        json.dump({'text_pool': text_pool, 'events': [mapping.to_dict() for mapping in events]}, f, ensure_ascii=False, indent=4)
 
-        with open('events.indent.json', 'w', encoding='utf-8') as f:
-            json.dump({'text_pool': string_pool, 'events': [mapping.to_dict() for mapping in events]}, f, ensure_ascii=False, indent=4)
+    with open('events.msgpack', 'wb') as f:
+        f.write(msgpack.packb({'text_pool': text_pool, 'events': [mapping.to_dict() for mapping in events]}))
 
-        with open('events.msgpack', 'wb') as f:
-            f.write(msgpack.packb({'text_pool': string_pool, 'events': [mapping.to_dict() for mapping in events]}))
-        
-        for mapping in events:
-            # Convert EventMapping to protobuf using the new method
-            pb_mapping = mapping.to_protobuf()
-            event_mappings_pb.events.append(pb_mapping)
+    for mapping in events:
+        # Convert EventMapping to protobuf using the new method
+        pb_mapping = mapping.to_protobuf()
+        event_mappings_pb.events.append(pb_mapping)
 
-        # Save as protobuf binary format
-        with open('events.pb', 'wb') as f:
-            f.write(event_mappings_pb.SerializeToString())
+    # Save as protobuf binary format
+    with open('events.pb', 'wb') as f:
+        f.write(event_mappings_pb.SerializeToString())
 
-    tqdm.write('✓ Database closed')
+    with open(HASHES_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'functions': hashes, 'events': event_index}, f)
 
 
 if __name__ == '__main__':
-    extract("./alive.exe.i64")
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description='Extract all texts and plot branches from the game database')
+    arg_parser.add_argument('db_path', nargs='?', default='./alive.exe.i64')
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help='extract events in this many processes, each with its own copy of the database')
+    arg_parser.add_argument('--cache', default='disasm_cache.sqlite',
+                            help='disassembly cache, keyed by the database content hash')
+    arg_parser.add_argument('--no-cache', action='store_true', help='always read from the database')
+    arg_parser.add_argument('-i', '--incremental', action='store_true',
+                            help='only re-extract events whose function changed since the last run')
+    arg_parser.add_argument('-e', '--event', type=int, action='append', default=[],
+                            help='with --incremental, also re-extract this evId')
+    arg_parser.add_argument('-f', '--function', action='append', default=[],
+                            help='with --incremental, also re-extract events of this function')
+    args = arg_parser.parse_args()
+    extract(args.db_path, args.workers, None if args.no_cache else args.cache,
+            args.incremental, set(args.event), set(args.function))
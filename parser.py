@@ -2,10 +2,128 @@ from ida_domain.operands import OperandType
 from ida_domain.operands import AccessType
 from tqdm import tqdm
 from constants import *
-from typing import List
+from disasm_cache import IdaSource
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import math
 
-string_pool = []
+class StringPool:
+    """Interned strings with stable ids in insertion order, referenced as '$<id>'"""
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, string: str) -> int:
+        """Id of string, adding it to the end of the pool on first sight"""
+        index = self._ids.get(string)
+        if index is None:
+            index = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.strings)
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+    def __contains__(self, string: str) -> bool:
+        return string in self._ids
+
+    def clear(self):
+        self.strings.clear()
+        self._ids.clear()
+
+    def merge(self, strings: List[str]) -> List[int]:
+        """Intern strings in order, returns the id each one has in this pool"""
+        return [self.intern(string) for string in strings]
+
+string_pool = StringPool()
+
+# Decoded C strings by address; the same BGM, image and SE names recur across events
+string_cache: Dict[int, str] = {}
+
+MAX_STRING_LENGTH = 1024
+
+# A call's arguments start at the nearest push within PUSH_WINDOW instructions before it
+PUSH_WINDOW = 7
+MAX_PARAMS = 20
+# The direct return value is set within the last RETURN_WINDOW instructions of a function
+RETURN_WINDOW = 7
+
+# Decoded operands carry enum member names (see disasm_cache.DecodedOperand)
+IMMEDIATE = OperandType.IMMEDIATE.name
+REGISTER = OperandType.REGISTER.name
+WRITE = AccessType.WRITE.name
+
+def as_source(db):
+    """Accept an ida_domain Database where a source of decoded functions is expected"""
+    return db if isinstance(db, IdaSource) else IdaSource(db)
+
+def _first_operand(inst):
+    return inst.operands[0] if inst.operands else None
+
+def _return_candidate(inst):
+    """(True, value) for push imm or mov eax, imm, the instructions that return values"""
+    if inst.is_indirect_jump_or_call: return False, None
+    operand = inst.operands
+    if len(operand) == 0 or operand[0] is None: return False, None
+    # push or mov eax, val
+    if operand[0].type == IMMEDIATE:
+        return True, operand[0].value
+    elif len(operand) == 2 and operand[0].type == REGISTER and operand[0].register == 'eax' and operand[0].access == WRITE and operand[1].type == IMMEDIATE:
+        return True, operand[1].value
+    return False, None
+
+class FunctionCode:
+    """Decoded instructions of one function, classified in a single pass
+
+    Per instruction this keeps whether the first operand exists and is an
+    immediate, its value, how many argument pushes end at it (run) and where the
+    nearest return value candidates before and after it are, so that the
+    parameter, return and choice scans are lookups rather than rescans. Negative
+    indices wrap around to the end like they do on the instruction list.
+    """
+    def __init__(self, instructions):
+        self.instructions = instructions
+        count = len(instructions)
+        self.has_operand = [False] * count
+        self.is_immediate = [False] * count
+        self.is_indirect = [False] * count
+        self.values = [None] * count
+        self.run = [0] * count
+        self.return_values = [None] * count
+        # Index of the nearest return candidate at or before / at or after i, -1 if none
+        self.last_return = [-1] * count
+        self.next_return = [-1] * (count + 1)
+
+        run = 0
+        last_return = -1
+        for i, inst in enumerate(instructions):
+            operand = _first_operand(inst)
+            if operand is not None:
+                self.has_operand[i] = True
+                if operand.type == IMMEDIATE:
+                    self.is_immediate[i] = True
+                    self.values[i] = operand.value
+            self.is_indirect[i] = inst.is_indirect_jump_or_call
+            run = run + 1 if self.is_immediate[i] and not self.is_indirect[i] else 0
+            self.run[i] = run
+            is_return, value = _return_candidate(inst)
+            if is_return:
+                self.return_values[i] = value
+                last_return = i
+            self.last_return[i] = last_return
+        for i in range(count - 1, -1, -1):
+            self.next_return[i] = i if self.last_return[i] == i else self.next_return[i + 1]
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def __getitem__(self, index: int):
+        return self.instructions[index]
 
 addresses = [
     PLAY_DIALOG_ADDR,
@@ -27,6 +145,72 @@ addresses = [
     SHOW_STAFF_B_ADDR,
 ]
 
+class CallDecoder:
+    """How to turn the pushed arguments of one engine call into an instruction
+
+    strings is the number of leading arguments that are string addresses, or a
+    function of the argument count. keep lists the argument indices kept as
+    params; None keeps whatever follows the strings. drop_tail arguments are cut
+    from the end first and min_params are required before any string is read.
+    type is the InstructionType id, None for calls that have none.
+    """
+    def __init__(self, type: Optional[int], strings=0, keep: Optional[Tuple[int, ...]] = None,
+                 drop_tail: int = 0, min_params: int = 0, choices: bool = False):
+        self.type = type
+        self.strings = strings
+        self.keep = keep
+        self.drop_tail = drop_tail
+        self.min_params = min_params
+        self.choices = choices
+
+    def decode(self, params, read_string: Callable[[int], str]):
+        """Split params into (params, string_params), reading strings in argument order"""
+        if self.min_params and len(params) < self.min_params:
+            raise IndexError('too few parameters')
+        if self.drop_tail:
+            if len(params) < self.drop_tail:
+                raise IndexError('too few parameters')
+            params = params[:-self.drop_tail]
+        count = self.strings(len(params)) if callable(self.strings) else self.strings
+        string_params = []
+        for index in range(count):
+            string_params.append(read_string(params[index]))
+        if self.keep is None:
+            return (params[count:] if count else params), string_params
+        return [params[index] for index in self.keep], string_params
+
+# Decision arguments are choice text addresses followed by as many values
+def _half(count: int) -> int:
+    return (count + 1) // 2
+
+# Calls with no decoder read their arguments like a decision, then abort the event
+UNKNOWN_CALL = CallDecoder(None, strings=_half)
+
+call_decoders: Dict[int, CallDecoder] = {}
+
+def register_call(addr: int, strings=0, keep: Optional[Tuple[int, ...]] = None, drop_tail: int = 0,
+                  min_params: int = 0, choices: bool = False):
+    """Add a decoder for the engine function at addr; its type is its position in addresses"""
+    call_type = addresses.index(addr) if addr in addresses else None
+    call_decoders[addr] = CallDecoder(call_type, strings, keep, drop_tail, min_params, choices)
+
+register_call(PLAY_DIALOG_ADDR, strings=1, keep=(4,), min_params=5)
+register_call(SHOW_DECISION_ADDR, strings=_half, choices=True)
+register_call(PLAY_BGM_ADDR, strings=1, keep=(), min_params=1)
+register_call(PLAY_SE_ADDR, strings=1, keep=(), min_params=1)
+register_call(SHOW_CG_ADDR, strings=1, keep=(1, 2, 3), min_params=4)
+register_call(SET_BG_IMG_ADDR, strings=2, keep=(2, 3))
+register_call(SET_CHARA_IMG_ADDR, strings=2, keep=(2, 3))
+register_call(TRANSITION_TO_GRAPHICS_ADDR, strings=4, drop_tail=2)
+register_call(TRANSITION_TO_GRAPHICS_FADE_ADDR, strings=4, drop_tail=2)
+for addr in [SLEEP_OR_FADE_ADDR, FADE_SYSTEM_TO_BLACK_ADDR, SHAKE_SCREEN_ADDR,
+             TOGGLE_STAFF_STATE, SHOW_STAFF_A_ADDR, SHOW_STAFF_B_ADDR]:
+    register_call(addr)
+register_call(SET_GRAPHICS_STATE_ADDR, keep=())
+register_call(TOGGLE_GRAPHICS_FLAG_ADDR, keep=())
+# Has no InstructionType: its string is read, then the event is dropped
+register_call(GET_TICK_COUNT_ADDR, strings=1)
+
 class EventMapping:
     def __init__(self, flag0: int, evId: int, flag1: int, voiceKey: str, evFunc: str, valueName: str, address: int, pos: int):
         self.flag0 = int(flag0)
@@ -41,96 +225,86 @@ class EventMapping:
         self.return_values = []
         self.has_choices = False
     
+    @classmethod
+    def from_dict(cls, d):
+        """Rebuild an extracted event from its to_dict() form, e.g. from a previous events.msgpack"""
+        mapping = cls.__new__(cls)
+        mapping.__dict__.update(d)
+        mapping.instructions = [dict(inst) for inst in d['instructions']]
+        mapping.return_values = list(d['return_values'])
+        return mapping
+
+    def function_hash(self, db):
+        """Hash of the bytes of this event's function, None if it has none"""
+        if self.evFunc in ['0', 0]: return None
+        db = as_source(db)
+        start_ea = db.function_start(self.evFunc)
+        return db.function_hash(start_ea) if start_ea is not None else None
+
     def get_instructions(self, db):
+        """db is an ida_domain Database or a disasm_cache source (IdaSource, CachedSource)"""
         if self.evFunc in ['0', 0]: return
         tqdm.write(f'getting instructions for {self.evFunc}...')
         
         # Or get the raw data for further processing
-        self.extract_function_calls(db)
+        self.extract_function_calls(as_source(db))
     
     def extract_function_calls(self, db):
-        """Extract function calls from IsCurrentLine branches using raw opcodes and operands"""
+        """Extract function calls from IsCurrentLine branches using decoded opcodes and operands"""
+        db = as_source(db)
         if isinstance(self.evFunc, int):
-            func_name = db.functions.get_at(self.evFunc).name
+            func_name = db.function_name(self.evFunc)
         else:
             func_name = self.evFunc.replace('(int)', '')
         
         try:
-            func = db.functions.get_function_by_name(func_name)
-            if not func:
+            start_ea = db.function_start(func_name)
+            if start_ea is None:
                 tqdm.write(f"Function {func_name} not found")
                 return []
             
-            if func.start_ea in exclude_subs or func.start_ea > 0x64c800:
+            if start_ea in exclude_subs or start_ea > 0x64c800:
                 tqdm.write(f"Function {func_name} is in exclude_subs or > 0x64c800")
                 return []
 
-            instructions = list(db.functions.get_instructions(func))
+            code = FunctionCode(db.instructions(start_ea))
 
-            for i in range(len(instructions)):
-                inst = instructions[i]
+            for i in range(len(code)):
+                inst = code[i]
                 
                 # Check if this is a call instruction using opcode
-                if db.instructions.is_call_instruction(inst):
-                    func = db.instructions.get_operand(inst, 0)
-                    f_name = func.get_name()
+                if inst.is_call:
+                    func = _first_operand(inst)
+                    f_name = func.name
                     if f_name in exclude_calls: continue
-                    func_addr = func.get_value()
+                    func_addr = func.value
                     if func_addr == IS_CURRENT_LINE_ADDR:
-                        calls = self._extract_line_parameter(db, instructions, i)
+                        calls = self._extract_line_parameter(db, code, i)
                         if calls is not None: current_line_index = calls
                     else:
-                        params = self._extract_parameters(db, instructions, i)
-                        string_params = []
-
-                        if func_addr in [PLAY_DIALOG_ADDR, PLAY_BGM_ADDR, PLAY_SE_ADDR, SHOW_CG_ADDR,
-                        GET_TICK_COUNT_ADDR]:
-                            if func_addr == PLAY_DIALOG_ADDR:
-                                params = [params[0], params[4]]
-                            elif func_addr == PLAY_BGM_ADDR:
-                                params = [params[0]]
-                            elif func_addr == PLAY_SE_ADDR:
-                                params = [params[0]]
-                            elif func_addr == SHOW_CG_ADDR:
-                                params = [params[0], params[1], params[2], params[3]]
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                        
-                        elif func_addr in [SET_BG_IMG_ADDR, SET_CHARA_IMG_ADDR]:
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            params = [params[0], params[1]]
-                        
-                        elif func_addr in [TRANSITION_TO_GRAPHICS_ADDR, TRANSITION_TO_GRAPHICS_FADE_ADDR]:
-                            params.pop(-1)
-                            params.pop(-1)
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            string_params.append(self._get_string_data(db, params.pop(0)))
-                            
-                        elif func_addr in [SLEEP_OR_FADE_ADDR, FADE_SYSTEM_TO_BLACK_ADDR, 
-                        SHAKE_SCREEN_ADDR,
-                        TOGGLE_STAFF_STATE, SHOW_STAFF_A_ADDR, SHOW_STAFF_B_ADDR]: pass
-
-                        elif func_addr in [SET_GRAPHICS_STATE_ADDR, TOGGLE_GRAPHICS_FLAG_ADDR]:
-                            params = []
-                    
-                        elif func_addr == SHOW_DECISION_ADDR:
-                            string_params = [self._get_string_data(db, params.pop(0)) for i in params]
+                        params = self._extract_parameters(db, code, i)
+                        decoder = call_decoders.get(func_addr)
+                        if decoder is None:
+                            params, string_params = UNKNOWN_CALL.decode(params, lambda addr: self._get_string_data(db, addr))
+                            tqdm.write(f'warning: unknown function: {f_name}: {params}')
+                        else:
+                            params, string_params = decoder.decode(params, lambda addr: self._get_string_data(db, addr))
+
+                        if decoder is not None and decoder.choices:
                             tqdm.write(f'Decision branch founded at: {current_line_index}')
                             tqdm.write(f'Decisions: {params}')
-                            ret = self._get_choices_return(db, instructions, i)
+                            ret = self._get_choices_return(db, code, i)
                             tqdm.write(f'Choices return: {ret}')
                             self.return_values = ret
                             self.has_choices = True
-                        else:
-                            string_params = [self._get_string_data(db, params.pop(0)) for i in params]
-                            tqdm.write(f'warning: unknown function: {f_name}: {params}')
 
-                        self.instructions.append({'name': f_name, 'params': params, 'string_params': string_params, 'type': addresses.index(func_addr)})
+                        # Calls without an instruction type abort the event, as they always have
+                        if decoder is None or decoder.type is None:
+                            raise ValueError(f'{f_name} has no instruction type')
+                        self.instructions.append({'name': f_name, 'params': params, 'string_params': string_params, 'type': decoder.type})
             
             if not self.has_choices:
-                retn = self._get_direct_return(db, instructions)
+                retn = self._get_direct_return(db, code)
                 tqdm.write(f'Direct return: {retn}')
                 self.return_values = [retn]
             
@@ -138,6 +312,12 @@ class EventMapping:
             tqdm.write(f"Error extracting function calls: {e}")
             return []
 
+    def remap_strings(self, id_map: List[int]):
+        """Rewrite '$<id>' string params after this event's pool was merged into another one"""
+        for inst in self.instructions:
+            inst['string_params'] = [f'${id_map[int(param[1:])]}' if param.startswith('$') else param
+                                     for param in inst['string_params']]
+
     def to_dict(self):
         d = self.__dict__
         if 'flag0' in d: del d['flag0']
@@ -172,90 +352,81 @@ class EventMapping:
         
         return pb_mapping
 
-    def _extract_line_parameter(self, db, instructions, call_index):
-        inst = db.instructions.get_operand(instructions[call_index-2], 0)
-        if inst.type != OperandType.IMMEDIATE:
+    def _extract_line_parameter(self, db, code, call_index):
+        inst = code[call_index-2]
+        operand = _first_operand(inst)
+        if operand.type != IMMEDIATE:
             tqdm.write("--------------------------------")
-            tqdm.write(f"get line parameter error: {inst.type} is not an immediate value")
-            disasm = db.instructions.get_disassembly(inst)
-            tqdm.write(disasm)
-            tqdm.write(db.instructions.get_operands(inst))
+            tqdm.write(f"get line parameter error: {operand.type} is not an immediate value")
+            tqdm.write(str(inst))
             tqdm.write("--------------------------------")
-            return None
-        return inst.get_value()
-
-    def _extract_parameters(self, db, instructions, call_index):
-        has_push = False
-        for i in range(call_index - 1, call_index - 8, -1):
-            inst = instructions[i]
-            operand = db.instructions.get_operand(inst, 0)
-            if operand.type == OperandType.IMMEDIATE:
-                has_push = True
+            # The event is dropped, as the extractor always did when it hit this
+            raise ValueError(f"line parameter at {inst.ea:#x} is not an immediate value")
+        return operand.value
+
+    def _extract_parameters(self, db, code, call_index):
+        count = len(code)
+        # Near the function start the window wraps around to the function end, as it always has
+        for i in range(call_index - 1, call_index - 1 - PUSH_WINDOW, -1):
+            if i < -count or not code.has_operand[i]:
+                raise ValueError(f"extract parameters error: unreadable instruction before {code[call_index].ea:#x}")
+            if code.is_immediate[i]:
                 break
-        if not has_push:
+        else:
             tqdm.write("--------------------------------")
             tqdm.write(f"extract parameters error: no push instruction before")
-            tqdm.write(instructions[call_index])
+            tqdm.write(str(code[call_index]))
             tqdm.write("--------------------------------")
             return None
+        # Take whole runs of pushes; a run reaching index 0 continues at the function end
         params = []
-        for i in range(i, i - 20, -1):
-            inst = instructions[i]
-            if db.instructions.is_indirect_jump_or_call(inst): break
-            operand = db.instructions.get_operand(inst, 0)
-            if operand.type != OperandType.IMMEDIATE: break
-            params.append(operand.get_value())
+        while len(params) < MAX_PARAMS:
+            if i < -count:
+                raise ValueError(f"extract parameters error: ran off the function start before {code[call_index].ea:#x}")
+            run = min(code.run[i], MAX_PARAMS - len(params))
+            if run == 0:
+                if not code.has_operand[i] and not code.is_indirect[i]:
+                    raise ValueError(f"extract parameters error: unreadable instruction at {code[i].ea:#x}")
+                break
+            params.extend(code.values[j] for j in range(i, i - run, -1))
+            i -= run
         return params
 
-    def _get_direct_return(self, db, instructions):
-        for i in range(-1, -8, -1):
-            inst = instructions[i]
-            if db.instructions.is_indirect_jump_or_call(inst): continue
-            operand = db.instructions.get_operands(inst)
-            if len(operand) == 0 or operand[0] is None: continue
-            # push or mov eax, val
-            if operand[0].type == OperandType.IMMEDIATE:
-                return operand[0].get_value()
-            elif len(operand) == 2 and operand[0].type == OperandType.REGISTER and operand[0].get_register_name() == 'eax' and operand[0].get_access_type() == AccessType.WRITE and operand[1].type == OperandType.IMMEDIATE:
-                return operand[1].get_value()
+    def _get_direct_return(self, db, code):
+        count = len(code)
+        last = code.last_return[-1] if count else -1
+        if count < RETURN_WINDOW and last == -1:
+            # Too short to hold the return window; such events have always been dropped
+            raise ValueError(f"function of {count} instructions has no direct return")
+        if last != -1 and last >= count - RETURN_WINDOW:
+            return code.return_values[last]
         return None
 
     def _get_string_data(self, db, addr):
         if addr < DATA_BOUNDARY[0] or addr > DATA_BOUNDARY[1]:
             return str(addr)
-        data = []
-        ptr = addr
-        try:
-            for i in range(1024):
-                byte_val = db.bytes.get_byte_at(ptr)
-                if byte_val == 0: break
-                data.append(byte_val)
-                ptr += 1
-            string = bytes(data).decode('shift-jis', errors='replace')
-            if string not in string_pool:
-                string_pool.append(string)
-            return f'${string_pool.index(string)}'
-        except Exception as e:
-            tqdm.write(f"Error getting string data: {e}")
-            return str(addr)
+        string = string_cache.get(addr)
+        if string is None:
+            try:
+                size = min(MAX_STRING_LENGTH, DATA_BOUNDARY[1] - addr + 1)
+                string = db.c_string(addr, size).decode('shift-jis', errors='replace')
+            except Exception as e:
+                tqdm.write(f"Error getting string data: {e}")
+                return str(addr)
+            string_cache[addr] = string
+        return f'${string_pool.intern(string)}'
 
-    def _get_choices_return(self, db, instructions, call_index):
+    def _get_choices_return(self, db, code, call_index):
         ret = []
-        for i in range(call_index + 7, instructions.__len__()):
-            inst = instructions[i]
-            if db.instructions.is_indirect_jump_or_call(inst): continue
-            operand = db.instructions.get_operands(inst)
-            if len(operand) == 0 or operand[0] is None: continue
-            # push or mov eax, val
-            if operand[0].type == OperandType.IMMEDIATE:
-                ret.append(operand[0].get_value())
-            elif len(operand) == 2 and operand[0].type == OperandType.REGISTER and operand[0].get_register_name() == 'eax' and operand[0].get_access_type() == AccessType.WRITE and operand[1].type == OperandType.IMMEDIATE:
-                ret.append(operand[1].get_value())
+        i = code.next_return[min(call_index + 7, len(code))]
+        while i != -1 and len(ret) < 3:
+            ret.append(code.return_values[i])
+            i = code.next_return[i + 1]
         
         # Clamp to exactly 3 items, add 0 if less
         while len(ret) < 3:
             ret.append(0)
-        return ret[:3]
+        return ret
     
     def __str__(self):
         return f"EventMapping(flag0={self.flag0}, evId={self.evId}, flag1={self.flag1}, voiceKey={self.voiceKey}, valueName={self.valueName}, evFunc={self.evFunc}, address={self.address}, pos={self.pos})"